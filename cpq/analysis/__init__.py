@@ -5,6 +5,7 @@ Módulos de análisis (terreno, límites, costes)
 from .boundaries import ParcelBoundaryAnalyzer
 from .terrain import (
     get_z_at_point,
+    get_z_at_points,
     compute_volume_metrics,
     calc_pendiente,
     get_xyz_from_pad,
@@ -23,6 +24,7 @@ from .costs import (
 __all__ = [
     'ParcelBoundaryAnalyzer',
     'get_z_at_point',
+    'get_z_at_points',
     'compute_volume_metrics',
     'calc_pendiente',
     'get_xyz_from_pad',
@@ -3,6 +3,8 @@ Análisis de límites y vallado de parcela
 """
 
 import math
+import numpy as np
+import shapely
 from shapely.geometry import Polygon, LineString, box
 from shapely.ops import unary_union
 from typing import List, Tuple, Optional
@@ -62,7 +64,7 @@ class ParcelBoundaryAnalyzer:
         outside_ring = parcel_geom.buffer(
             CFG.OUTSIDE_RING_WIDTH,
             join_style=2
-        ).difference(parcel_geom.buffer(0, join_style=2))
+        ).difference(self._make_valid(parcel_geom))
 
         priv_out = self._safe_int(outside_ring, merged_priv, CFG.NEIGHBOR_EPSILON)
         pub_cat_out = (self._safe_int(outside_ring, street_zone, CFG.NEIGHBOR_EPSILON)
@@ -72,12 +74,12 @@ class ParcelBoundaryAnalyzer:
         pub_osm_out = self._fetch_osm_zone(bbox, outside_ring)
 
         # Clasificar segmentos
-        front_segs, lat_segs, stats = self._classify_segments(
+        front_segs, lat_segs, make_stats = self._classify_segments(
             polys, pub_cat_out, pub_osm_out, priv_out
         )
 
-        front_len = unary_union(front_segs).length if front_segs else 0.0
-        lat_len = unary_union(lat_segs).length if lat_segs else 0.0
+        front_len = self._length(front_segs)
+        lat_len = self._length(lat_segs)
 
         if (front_len + lat_len) > total_perim * 0.995:
             lat_len = max(0.0, total_perim - front_len)
@@ -85,9 +87,9 @@ class ParcelBoundaryAnalyzer:
         # Rescate si no hay frontal
         if front_len < 0.05 and (pub_osm_out or merged_pub):
             print("RESCATE aplicado")
-            front_segs, lat_segs = self._rescue(stats)
-            front_len = unary_union(front_segs).length if front_segs else 0.0
-            lat_len = unary_union(lat_segs).length if lat_segs else 0.0
+            front_segs, lat_segs = self._rescue(make_stats())
+            front_len = self._length(front_segs)
+            lat_len = self._length(lat_segs)
             if (front_len + lat_len) > total_perim * 0.995:
                 lat_len = max(0.0, total_perim - front_len)
 
@@ -110,17 +112,32 @@ class ParcelBoundaryAnalyzer:
                   else ('label' if 'label' in gdf_nei.columns else None))
 
         if id_col is None:
-            return unary_union(gdf_nei.geometry).buffer(0), None
+            return self._make_valid(self._union_parcels(gdf_nei.geometry)), None
 
         gdf_nei = gdf_nei[gdf_nei[id_col].astype(str) != str(refcat14)]
         priv = gdf_nei[gdf_nei[id_col].notna()]
         pub = gdf_nei[gdf_nei[id_col].isna()]
 
-        mp = unary_union(priv.geometry).buffer(0) if not priv.empty else None
-        mu = unary_union(pub.geometry).buffer(0) if not pub.empty else None
+        mp = (self._make_valid(self._union_parcels(priv.geometry))
+              if not priv.empty else None)
+        mu = (self._make_valid(self._union_parcels(pub.geometry))
+              if not pub.empty else None)
 
         return mp, mu
 
+    def _union_parcels(self, geoms):
+        """Une parcelas catastrales; al no solaparse basta la unión de cobertura"""
+        arr = np.asarray(geoms)
+        try:
+            merged = shapely.coverage_union_all(arr)
+            if merged.is_valid:
+                return merged
+        except shapely.errors.GEOSException:
+            pass
+
+        # Cobertura no válida (solapes o nodos no coincidentes)
+        return shapely.union_all(arr)
+
     def _detect_street_zone(self, merged_pub, parcel_geom):
         """Detecta zona de calle desde vecinos públicos"""
         if merged_pub is None or merged_pub.is_empty:
@@ -164,88 +181,112 @@ class ParcelBoundaryAnalyzer:
 
         return None
 
+    def _make_valid(self, g):
+        """Repara la geometría conservando solo su parte poligonal"""
+        g = shapely.make_valid(g)
+        if g.geom_type == 'GeometryCollection':
+            g = unary_union([p for p in g.geoms
+                             if p.geom_type in ('Polygon', 'MultiPolygon')])
+        return g
+
     def _safe_int(self, g1, g2, eps):
         """Intersección segura con buffer de epsilon"""
         if g2 is None or g2.is_empty:
             return None
         result = g1.intersection(g2.buffer(eps))
-        return result.buffer(0) if not result.is_empty else None
+        return self._make_valid(result) if not result.is_empty else None
 
     def _fetch_osm_zone(self, bbox, outside_ring):
         """Obtiene zona OSM buffereada"""
+        # Bbox degenerado (vacío, NaN o sin extensión): no hay nada que consultar
+        if bbox is None or len(bbox) != 4:
+            return None
+        minx, miny, maxx, maxy = bbox
+        if not (maxx > minx and maxy > miny):
+            return None
+
         try:
             gdf_roads = self.osm.fetch_roads(bbox)
             if gdf_roads.empty:
                 return None
 
-            roads_buf = unary_union(
+            roads_buf = shapely.union_all(np.asarray(
                 gdf_roads.buffer(CFG.ROAD_BUFFER, cap_style=2, join_style=2)
-            )
+            ))
             pub_osm = outside_ring.intersection(
                 roads_buf.buffer(CFG.NEIGHBOR_EPSILON)
             )
-            return pub_osm.buffer(0) if not pub_osm.is_empty else None
+            return self._make_valid(pub_osm) if not pub_osm.is_empty else None
         except:
             return None
 
     def _classify_segments(self, polys, pub_cat, pub_osm, priv):
         """Clasifica segmentos del perímetro en frontal/lateral"""
-        front, lat, stats = [], [], []
-
-        for poly in polys:
-            coords = list(poly.exterior.coords)
-
-            for i in range(len(coords) - 1):
-                seg = LineString([coords[i], coords[i + 1]])
-
-                if seg.length <= 1e-6:
-                    continue
-
-                seg_buf = seg.buffer(
-                    CFG.SEGMENT_BUFFER,
-                    cap_style=2,
-                    join_style=2
-                )
-
-                area_cat = self._int_area(seg_buf, pub_cat)
-                area_osm = self._int_area(seg_buf, pub_osm)
-                area_priv = self._int_area(seg_buf, priv)
-
-                decided = False
-
-                if area_osm > max(area_cat, area_priv) + CFG.AREA_TOLERANCE:
-                    front.append(seg)
-                    decided = True
-                elif area_cat > max(area_osm, area_priv) + CFG.AREA_TOLERANCE:
-                    front.append(seg)
-                    decided = True
-                else:
-                    if pub_osm and not pub_osm.is_empty:
-                        c = seg_buf.representative_point()
-                        d = c.distance(pub_osm.boundary)
-                        if d <= CFG.ROAD_DISTANCE_MAX:
-                            front.append(seg)
-                            decided = True
-
-                if not decided:
-                    lat.append(seg)
-
-                cpt = seg_buf.representative_point()
-                d_osm_c = cpt.distance(pub_osm) if pub_osm else float('inf')
-                d_cat_c = cpt.distance(pub_cat) if pub_cat else float('inf')
-                score = (1.0 * area_osm + 0.7 * area_cat +
-                        0.25 / (d_osm_c + 0.1) + 0.10 / (d_cat_c + 0.1))
-
-                stats.append((seg, score, area_osm, area_cat, area_priv))
-
-        return front, lat, stats
-
-    def _int_area(self, g1, g2):
-        """Área de intersección"""
-        if g2 is None or g2.is_empty:
-            return 0.0
-        inter = g1.intersection(g2)
-        return inter.area if not inter.is_empty else 0.0
+        # Pares de vértices consecutivos de los anillos exteriores: (N, 2, 2)
+        rings = [shapely.get_coordinates(poly.exterior) for poly in polys]
+        pairs = np.concatenate([
+            np.stack([ring[:-1], ring[1:]], axis=1) for ring in rings
+        ])
+        lengths = np.hypot(*(pairs[:, 1] - pairs[:, 0]).T)
+        pairs = pairs[lengths > 1e-6]
+
+        segs = shapely.linestrings(pairs)
+        seg_bufs = shapely.buffer(
+            segs,
+            CFG.SEGMENT_BUFFER,
+            cap_style='flat',
+            join_style='mitre'
+        )
+
+        tree = shapely.STRtree(seg_bufs)
+        area_cat = self._int_areas(tree, seg_bufs, pub_cat)
+        area_osm = self._int_areas(tree, seg_bufs, pub_osm)
+        area_priv = self._int_areas(tree, seg_bufs, priv)
+
+        tol = CFG.AREA_TOLERANCE
+        is_front = ((area_osm > np.maximum(area_cat, area_priv) + tol) |
+                    (area_cat > np.maximum(area_osm, area_priv) + tol))
+
+        reps = None
+
+        # Indecisos: frontal si quedan cerca de la calzada OSM
+        if pub_osm and not pub_osm.is_empty:
+            reps = shapely.point_on_surface(seg_bufs)
+            rest = np.flatnonzero(~is_front)
+            d = shapely.distance(reps[rest], pub_osm.boundary)
+            is_front[rest] = d <= CFG.ROAD_DISTANCE_MAX
+
+        front = segs[is_front].tolist()
+        lat = segs[~is_front].tolist()
+
+        def make_stats():
+            """Puntuación para el rescate (solo se calcula si se necesita)"""
+            pts = reps if reps is not None else shapely.point_on_surface(seg_bufs)
+            d_osm = (shapely.distance(pts, pub_osm) if pub_osm
+                     else np.full(len(segs), np.inf))
+            d_cat = (shapely.distance(pts, pub_cat) if pub_cat
+                     else np.full(len(segs), np.inf))
+            score = (1.0 * area_osm + 0.7 * area_cat +
+                     0.25 / (d_osm + 0.1) + 0.10 / (d_cat + 0.1))
+
+            return list(zip(
+                segs.tolist(), score.tolist(), area_osm.tolist(),
+                area_cat.tolist(), area_priv.tolist()
+            ))
+
+        return front, lat, make_stats
+
+    def _int_areas(self, tree, seg_bufs, g):
+        """Áreas de intersección de cada buffer con la zona"""
+        areas = np.zeros(len(seg_bufs))
+        if g is None or g.is_empty:
+            return areas
+
+        # Solo se intersectan los buffers que tocan la zona
+        shapely.prepare(g)
+        idx = tree.query(g, predicate='intersects')
+        areas[idx] = shapely.area(shapely.intersection(seg_bufs[idx], g))
+        return areas
 
     def _rescue(self, stats):
         """Rescate cuando no se detecta frontal"""
@@ -267,12 +308,19 @@ class ParcelBoundaryAnalyzer:
                                     key=lambda s: s.length,
                                     reverse=True)[0])
 
-        new_front = [seg for seg, *_ in stats
-                    if seg.buffer(1e-6).intersects(rescue_front.buffer(1e-6))]
-        new_lat = [seg for seg, *_ in stats
-                  if not seg.buffer(1e-6).intersects(rescue_front.buffer(1e-6))]
+        # Segmentos a menos de 2e-6 m del frontal rescatado
+        segs = np.array([t[0] for t in stats], dtype=object)
+        tree = shapely.STRtree(segs)
+        hit = np.zeros(len(segs), dtype=bool)
+        hit[tree.query(rescue_front, predicate='dwithin', distance=2e-6)] = True
+
+        return segs[hit].tolist(), segs[~hit].tolist()
 
-        return new_front, new_lat
+    def _length(self, segs):
+        """Longitud total de segmentos disjuntos del perímetro"""
+        if not segs:
+            return 0.0
+        return float(shapely.length(np.asarray(segs, dtype=object)).sum())
 
     def _fence_cost(self, front_ml, lat_ml):
         """Calcula coste de vallado"""
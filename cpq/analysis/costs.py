@@ -2,6 +2,7 @@
 Cálculos de costes de implantación
 """
 
+import functools
 import numpy as np
 from shapely.geometry import Point
 from shapely.ops import nearest_points
@@ -9,7 +10,37 @@ import geopandas as gpd
 from typing import Tuple
 
 from ..config import CFG
-from .terrain import get_z_at_point
+from .terrain import get_z_at_points
+
+
+@functools.lru_cache(maxsize=8)
+def _tier_arrays(tramos: tuple) -> Tuple[np.ndarray, np.ndarray]:
+    """Arrays (umbrales, costes) de una matriz de tramos ((umbral, coste), ...)"""
+    arr = np.array(tramos, dtype=float).reshape(-1, 2)
+    return arr[:, 0], arr[:, 1]
+
+
+def _tier_cost(matriz, clave_umbral: str, valor: float) -> float:
+    """
+    Coste del primer tramo con umbral >= valor (0 si ninguno lo cubre)
+
+    La matriz se lee de CFG en cada llamada, así que se respetan los cambios
+    en tiempo de ejecución; los arrays para la búsqueda binaria se cachean
+    por contenido (umbrales ascendentes).
+
+    Args:
+        matriz: Lista de tramos de CFG (dicts con clave_umbral y coste_adicional)
+        clave_umbral: Clave del umbral en cada tramo
+        valor: Valor a clasificar
+
+    Returns:
+        Coste adicional del tramo
+    """
+    umbrales, costes = _tier_arrays(
+        tuple((t[clave_umbral], t["coste_adicional"]) for t in matriz)
+    )
+    i = int(np.searchsorted(umbrales, valor, side="left"))
+    return float(costes[i]) if i < costes.size else 0.0
 
 
 def compute_horizontal_access_costs(
@@ -62,22 +93,16 @@ def compute_vertical_access_costs(
         if mdt_path is None:
             return 0.0, 0.0
 
-        z_calle = get_z_at_point(mdt_path, access_point)
-        z_parking = get_z_at_point(
+        z_calle, z_parking = get_z_at_points(
             mdt_path,
-            p_parking if p_parking else access_point
+            [access_point, p_parking if p_parking else access_point]
         )
 
         if np.isnan(z_calle) or np.isnan(z_parking):
             return 0.0, 0.0
 
         delta = float(abs(z_parking - z_calle))
-        coste = 0.0
-
-        for tramo in CFG.MATRIZ_COSTE_ACCESO_VERTICAL:
-            if delta <= tramo["max_dif_metros"]:
-                coste = float(tramo["coste_adicional"])
-                break
+        coste = _tier_cost(CFG.MATRIZ_COSTE_ACCESO_VERTICAL, "max_dif_metros", delta)
 
         return delta, coste
 
@@ -154,11 +179,9 @@ def compute_containment_cost(
     coste_muro = muro_result.get('total_coste_€', 0.0) if muro_result else 0.0
 
     # Sobrecoste por pendiente
-    sobrecoste_pendiente = 0.0
-    for tier in CFG.MATRIZ_CIMENTACION_PENDIENTE:
-        if slope_pct <= tier['max_pendiente']:
-            sobrecoste_pendiente = tier['coste_adicional']
-            break
+    sobrecoste_pendiente = _tier_cost(
+        CFG.MATRIZ_CIMENTACION_PENDIENTE, "max_pendiente", slope_pct
+    )
 
     total = coste_muro + sobrecoste_pendiente
 
@@ -2,11 +2,17 @@
 Análisis topográfico y de terreno
 """
 
+import functools
 import math
+import os
 import numpy as np
 import rasterio
 import rasterio.mask
+from rasterio.transform import Affine
+from rasterio.features import rasterize
+from rasterio.windows import Window
 import geopandas as gpd
+import shapely
 from shapely.geometry import Point
 from shapely.ops import unary_union
 from typing import Dict, Tuple, List, Optional
@@ -14,31 +20,89 @@ from typing import Dict, Tuple, List, Optional
 from ..config import CFG
 
 
-def get_z_at_point(raster_path: str, point: Point) -> float:
+def _read_band_nan(src) -> np.ndarray:
     """
-    Obtiene la cota Z en un punto específico
+    Lee la banda 1 como float32 con los valores nodata sustituidos por NaN
+
+    Args:
+        src: Dataset rasterio abierto
+
+    Returns:
+        Array 2D de cotas
+    """
+    band = src.read(1).astype(np.float32)
+    if src.nodata is not None:
+        band[band == src.nodata] = np.nan
+    return band
+
+
+def _load_mdt(raster_path: str) -> Tuple[np.ndarray, Affine]:
+    """
+    Carga el MDT (banda con NaN y afín inversa) con caché por fichero
+
+    La caché se indexa por ruta, fecha de modificación y tamaño, de modo
+    que un MDT reescrito en la misma ruta se vuelve a leer.
 
     Args:
         raster_path: Ruta al archivo raster MDT
-        point: Punto geométrico
 
     Returns:
-        Cota Z o np.nan si no disponible
+        Tuple (banda, transformada_inversa)
     """
-    if raster_path is None:
-        return np.nan
+    st = os.stat(raster_path)
+    return _load_mdt_cached(raster_path, st.st_mtime_ns, st.st_size)
 
-    try:
-        with rasterio.open(raster_path) as src:
-            samples = list(src.sample([(point.x, point.y)]))
-            z = float(samples[0][0])
 
-            if src.nodata is not None and z == src.nodata:
-                return np.nan
+@functools.lru_cache(maxsize=2)
+def _load_mdt_cached(raster_path: str, mtime_ns: int, size: int):
+    with rasterio.open(raster_path) as src:
+        return _read_band_nan(src), ~src.transform
 
-            return z
+
+def get_z_at_points(raster_path: str, points: List[Point]) -> np.ndarray:
+    """
+    Obtiene las cotas Z de varios puntos en una sola lectura
+
+    Args:
+        raster_path: Ruta al archivo raster MDT
+        points: Lista de puntos geométricos
+
+    Returns:
+        Array de cotas Z (np.nan donde no hay dato)
+    """
+    zs = np.full(len(points), np.nan)
+    if raster_path is None or not points:
+        return zs
+
+    try:
+        band, inv_transform = _load_mdt(raster_path)
+        xs = np.array([p.x for p in points])
+        ys = np.array([p.y for p in points])
+
+        cols, rows = inv_transform * (xs, ys)
+        rows = np.floor(rows).astype(int)
+        cols = np.floor(cols).astype(int)
+        dentro = ((rows >= 0) & (rows < band.shape[0]) &
+                  (cols >= 0) & (cols < band.shape[1]))
+
+        zs[dentro] = band[rows[dentro], cols[dentro]]
+        return zs
     except:
-        return np.nan
+        return zs
+
+
+def get_z_at_point(raster_path: str, point: Point) -> float:
+    """
+    Obtiene la cota Z en un punto específico
+
+    Args:
+        raster_path: Ruta al archivo raster MDT
+        point: Punto geométrico
+
+    Returns:
+        Cota Z o np.nan si no disponible
+    """
+    return float(get_z_at_points(raster_path, [point])[0])
 
 
 def compute_volume_metrics(
@@ -68,29 +132,41 @@ def compute_volume_metrics(
             if pad_gdf.crs != src.crs:
                 pad_gdf = pad_gdf.to_crs(src.crs)
 
-            out_image, out_transform = rasterio.mask.mask(
-                src,
-                pad_gdf.geometry,
-                crop=True,
-                filled=False,
-                all_touched=True
-            )
+            # Ventana del raster que cubre la huella
+            minx, miny, maxx, maxy = pad_gdf.total_bounds
+            inv_transform = ~src.transform
+            col0, row0 = inv_transform * (minx, maxy)
+            col1, row1 = inv_transform * (maxx, miny)
+            row0 = max(int(math.floor(row0)), 0)
+            col0 = max(int(math.floor(col0)), 0)
+            row1 = min(int(math.ceil(row1)), src.height)
+            col1 = min(int(math.ceil(col1)), src.width)
+
+            if row1 <= row0 or col1 <= col0:
+                return {
+                    "z_optimal_m": 0.0,
+                    "cut_m3": 0.0,
+                    "fill_m3": 0.0,
+                    "balance_m3": 0.0
+                }
+
+            window = Window.from_slices((row0, row1), (col0, col1))
+            data = src.read(1, window=window).astype(float)
 
-            if hasattr(out_image, 'mask'):
-                out_float = out_image[0].astype(float)
-                if hasattr(out_image[0], 'fill_value'):
-                    fill_val = float(out_image[0].fill_value)
-                    data = np.ma.filled(out_float, fill_value=fill_val)
-                    data[data == fill_val] = np.nan
-                else:
-                    data = np.ma.filled(out_float, fill_value=np.nan)
-            else:
-                data = out_image[0].astype(float)
+            # Píxeles tocados por la huella
+            inside = rasterize(
+                [(geom, 1) for geom in pad_gdf.geometry],
+                out_shape=data.shape,
+                transform=src.window_transform(window),
+                all_touched=True,
+                dtype="uint8"
+            ).astype(bool)
 
+            z = data[inside]
             if src.nodata is not None:
-                data[data == src.nodata] = np.nan
+                z[z == src.nodata] = np.nan
 
-            z_valid = data[~np.isnan(data)]
+            z_valid = z[~np.isnan(z)]
 
             if z_valid.size == 0:
                 return {
@@ -101,12 +177,11 @@ def compute_volume_metrics(
                 }
 
             z_opt = float(np.mean(z_valid))
-            diff = data - z_opt
+            diff = z_valid - z_opt
             pixel_area = abs(src.transform.a * src.transform.e)
-            diff_valid = diff[~np.isnan(diff)]
 
-            cut_m3 = float(np.sum(diff_valid[diff_valid > 0]) * pixel_area)
-            fill_m3 = float(np.sum(np.abs(diff_valid[diff_valid < 0])) * pixel_area)
+            cut_m3 = float(np.maximum(diff, 0.0).sum() * pixel_area)
+            fill_m3 = float(-np.minimum(diff, 0.0).sum() * pixel_area)
 
             return {
                 "z_optimal_m": z_opt,
@@ -141,9 +216,15 @@ def calc_pendiente(xs, ys, zs) -> Tuple:
         return 0.0, 0.0, 0.0, 0.0
 
     try:
-        A = np.c_[xs, ys, np.ones_like(xs)]
-        C, *_ = np.linalg.lstsq(A, zs, rcond=None)
-        a, b = float(C[0]), float(C[1])
+        # Ecuaciones normales del plano z = a·x + b·y + c sobre coordenadas
+        # centradas: la ordenada desaparece y queda un sistema 2x2
+        xc = np.asarray(xs, dtype=float) - np.mean(xs)
+        yc = np.asarray(ys, dtype=float) - np.mean(ys)
+        zc = np.asarray(zs, dtype=float) - np.mean(zs)
+
+        sxy = float(xc @ yc)
+        M = np.array([[xc @ xc, sxy], [sxy, yc @ yc]])
+        a, b = (float(v) for v in np.linalg.solve(M, [xc @ zc, yc @ zc]))
         p_EO = float(a * 100.0)
         p_NS = float(b * 100.0)
         p_tot = float(np.hypot(p_EO, p_NS))
@@ -185,15 +266,15 @@ def get_xyz_from_pad(
             data = np.ma.filled(band.astype("float32"), np.nan)
             ii, jj = np.where(~np.isnan(data))
 
-            xs, ys, zs = [], [], []
-            for i, j in zip(ii, jj):
-                x, y = rasterio.transform.xy(out_transform, int(i), int(j))
-                if pad_geom.contains(Point(x, y)):
-                    xs.append(x)
-                    ys.append(y)
-                    zs.append(float(data[i, j]))
+            # Centros de píxel y test de pertenencia en una sola llamada GEOS
+            xs, ys = rasterio.transform.xy(out_transform, ii, jj)
+            xs = np.asarray(xs, dtype=float)
+            ys = np.asarray(ys, dtype=float)
+            inside = shapely.contains_xy(pad_geom, xs, ys)
 
-            return np.array(xs), np.array(ys), np.array(zs)
+            zs = data[ii[inside], jj[inside]].astype(float)
+
+            return xs[inside], ys[inside], zs
 
     except Exception as e:
         print(f"Error XYZ: {e}")
@@ -224,7 +305,9 @@ def dimensionar_muro_perimetral_real(
         terreno_blando: Si True, excluye escollera
 
     Returns:
-        Dict con información del muro
+        Dict con información del muro. detalle_lados contiene una lista
+        por campo (x, y, dist_hasta_linde_m, altura_muro_m, espesor_m,
+        volumen_m3) con un valor por perfil
     """
     if mdt_path is None:
         return {
@@ -232,7 +315,14 @@ def dimensionar_muro_perimetral_real(
             "coste_unit_€_m3": 0.0,
             "total_volumen_m3": 0.0,
             "total_coste_€": 0.0,
-            "detalle_lados": [],
+            "detalle_lados": {
+                "x": [],
+                "y": [],
+                "dist_hasta_linde_m": [],
+                "altura_muro_m": [],
+                "espesor_m": [],
+                "volumen_m3": []
+            },
             "h_max_global_m": 0.0
         }
 
@@ -242,14 +332,6 @@ def dimensionar_muro_perimetral_real(
         "hormigon_armado": {"coste_m3": 450, "h_max": 8.0}
     }
 
-    def espesor_por_altura(h):
-        if h < 1.5:
-            return 0.30
-        elif h < 3.0:
-            return 0.50
-        else:
-            return 0.70
-
     plataforma_poly = pad_gdf.geometry.iloc[0]
 
     # Orientación
@@ -258,100 +340,94 @@ def dimensionar_muro_perimetral_real(
     else:
         normal_sign = -1.0
 
-    coords = list(plataforma_poly.exterior.coords)
-    detalle_perfiles = []
-    volumen_total = 0.0
-    h_max_global = 0.0
-
-    with rasterio.open(mdt_path) as src:
-        from shapely.geometry import LineString
-        from shapely.ops import nearest_points
-
-        data_band = src.read(1)
-
-        for i in range(len(coords) - 1):
-            p1 = coords[i]
-            p2 = coords[i + 1]
-            lado = LineString([p1, p2])
-            longitud_lado = lado.length
-            n_perfiles = max(1, int(math.ceil(longitud_lado / paso_perfil)))
-
-            for k in range(n_perfiles + 1):
-                t = min(1.0, k / n_perfiles)
-                x = p1[0] + (p2[0] - p1[0]) * t
-                y = p1[1] + (p2[1] - p1[1]) * t
-
-                # Vector del lado y normal
-                vx, vy = p2[0] - p1[0], p2[1] - p1[1]
-                nx, ny = -vy, vx
-                long_n = math.hypot(nx, ny)
-                if long_n == 0:
-                    continue
-                nx, ny = nx / long_n, ny / long_n
-                nx, ny = normal_sign * nx, normal_sign * ny
-
-                # Rayo hacia fuera
-                ray_len = 200.0
-                ray = LineString([(x, y), (x + nx * ray_len, y + ny * ray_len)])
-                inter = ray.intersection(parcel_geom.boundary)
-
-                if inter.is_empty:
-                    continue
-
-                # Punto límite más cercano
-                if inter.geom_type == "MultiPoint":
-                    dmin = 1e9
-                    closest = None
-                    for pt in inter.geoms:
-                        d = Point(x, y).distance(pt)
-                        if d < dmin:
-                            dmin = d
-                            closest = pt
-                    limite_pt = closest
-                elif inter.geom_type == "Point":
-                    limite_pt = inter
-                else:
-                    limite_pt = nearest_points(Point(x, y), inter)[1]
-
-                dist_out = Point(x, y).distance(limite_pt)
-
-                if dist_out < 0.2:
-                    h_perfil = 0.0
-                else:
-                    # Muestrear terreno cada 1 m
-                    paso_mdt = 1.0
-                    n_muestras = max(1, int(math.ceil(dist_out / paso_mdt)))
-                    alturas = []
-
-                    for s in range(1, n_muestras + 1):
-                        xx = x + nx * (s * paso_mdt)
-                        yy = y + ny * (s * paso_mdt)
-                        try:
-                            row, col = src.index(xx, yy)
-                            z_nat = float(data_band[row, col])
-                            if src.nodata is not None and z_nat == src.nodata:
-                                continue
-                            h_local = max(cota_plataforma - z_nat, 0.0)
-                            alturas.append(h_local)
-                        except Exception:
-                            continue
-
-                    h_perfil = max(alturas) if alturas else 0.0
-
-                h_max_global = max(h_max_global, h_perfil)
-
-                esp = espesor_por_altura(h_perfil) if h_perfil > 0 else 0.0
-                vol_perfil = h_perfil * esp * paso_perfil
-                volumen_total += vol_perfil
-
-                detalle_perfiles.append({
-                    "x": round(x, 2),
-                    "y": round(y, 2),
-                    "dist_hasta_linde_m": round(dist_out, 2),
-                    "altura_muro_m": round(h_perfil, 2),
-                    "espesor_m": round(esp, 2),
-                    "volumen_m3": round(vol_perfil, 3)
-                })
+    # Lados del anillo exterior (los de longitud nula se descartan)
+    ring = shapely.get_coordinates(plataforma_poly.exterior)
+    p1 = ring[:-1]
+    v = ring[1:] - p1
+    longitudes = np.hypot(v[:, 0], v[:, 1])
+    ok = longitudes > 0
+    p1, v, longitudes = p1[ok], v[ok], longitudes[ok]
+
+    # Estaciones de perfil de todos los lados, extremos incluidos
+    n_perfiles = np.maximum(1, np.ceil(longitudes / paso_perfil)).astype(int)
+    lado = np.repeat(np.arange(n_perfiles.size), n_perfiles + 1)
+    inicio = np.cumsum(n_perfiles + 1) - (n_perfiles + 1)
+    t = (np.arange(lado.size) - inicio[lado]) / n_perfiles[lado]
+
+    xs = p1[lado, 0] + v[lado, 0] * t
+    ys = p1[lado, 1] + v[lado, 1] * t
+
+    # Normal exterior unitaria de cada estación
+    nxs = -normal_sign * v[lado, 1] / longitudes[lado]
+    nys = normal_sign * v[lado, 0] / longitudes[lado]
+
+    # Rayos hacia fuera: intersección con el linde en una sola llamada GEOS
+    ray_len = 200.0
+    rays = shapely.linestrings(np.stack([
+        np.column_stack([xs, ys]),
+        np.column_stack([xs + nxs * ray_len, ys + nys * ray_len])
+    ], axis=1))
+    inter = shapely.intersection(rays, parcel_geom.boundary)
+
+    # Distancia al punto límite más cercano de cada rayo. Las intersecciones
+    # son puntos o tramos colineales con el rayo, así que basta con sus
+    # vértices; los rayos sin intersección quedan a distancia infinita
+    pts, ray_idx = shapely.get_coordinates(inter, return_index=True)
+    dists = np.full(xs.size, np.inf)
+    np.minimum.at(
+        dists, ray_idx,
+        np.hypot(pts[:, 0] - xs[ray_idx], pts[:, 1] - ys[ray_idx])
+    )
+    hit = np.isfinite(dists)
+
+    xs, ys, nxs, nys, dists = xs[hit], ys[hit], nxs[hit], nys[hit], dists[hit]
+
+    data_band, inv_transform = _load_mdt(mdt_path)
+    n_rows, n_cols = data_band.shape
+
+    # Muestras de terreno cada 1 m de todos los perfiles en un único array;
+    # los perfiles a menos de 0.2 m del linde no se muestrean
+    paso_mdt = 1.0
+    n_muestras = np.where(
+        dists < 0.2, 0, np.maximum(1, np.ceil(dists / paso_mdt))
+    ).astype(int)
+    perfil = np.repeat(np.arange(dists.size), n_muestras)
+    inicio = np.cumsum(n_muestras) - n_muestras
+    s = (np.arange(perfil.size) - inicio[perfil] + 1) * paso_mdt
+
+    # Coordenadas → fila/columna con la afín inversa
+    cols, rows = inv_transform * (xs[perfil] + nxs[perfil] * s,
+                                  ys[perfil] + nys[perfil] * s)
+    rows = np.floor(rows).astype(int)
+    cols = np.floor(cols).astype(int)
+    dentro = (rows >= 0) & (rows < n_rows) & (cols >= 0) & (cols < n_cols)
+
+    z_nat = np.full(perfil.size, np.nan)
+    z_nat[dentro] = data_band[rows[dentro], cols[dentro]]
+
+    # Altura por perfil: máximo de las muestras válidas (fmax ignora NaN)
+    alturas = np.zeros(dists.size)
+    np.maximum.at(alturas, perfil, np.fmax(cota_plataforma - z_nat, 0.0))
+
+    espesores = np.select(
+        [alturas <= 0, alturas < 1.5, alturas < 3.0],
+        [0.0, 0.30, 0.50],
+        0.70
+    )
+    volumenes = alturas * espesores * paso_perfil
+
+    volumen_total = float(volumenes.sum())
+    h_max_global = float(alturas.max()) if alturas.size else 0.0
+
+    # Detalle por perfil como columnas (una lista por campo)
+    detalle_perfiles = {
+        "x": np.round(xs, 2).tolist(),
+        "y": np.round(ys, 2).tolist(),
+        "dist_hasta_linde_m": np.round(dists, 2).tolist(),
+        "altura_muro_m": np.round(alturas, 2).tolist(),
+        "espesor_m": np.round(espesores, 2).tolist(),
+        "volumen_m3": np.round(volumenes, 3).tolist()
+    }
 
     # Elegir tipo de muro
     opciones = []
@@ -2,8 +2,67 @@
 Interfaz de línea de comandos (CLI)
 """
 
+import re
+import sys
+from itertools import groupby
 from typing import Optional, List, Tuple
-from .models import CONSTRUCTION_PRICES, EXTRAS_CATALOG
+from .models import EXTRAS_ORDERED, LEVELS_BY_SYSTEM, SYSTEMS, price_of
+from .services.catastro import is_valid_refcat14
+
+
+# Entero con signo opcional y espacios alrededor
+_INT_RE = re.compile(r"\s*([+-]?\d+)\s*$")
+
+
+def _read_line(prompt: str = "") -> str:
+    """
+    Lee una línea de la entrada estándar
+
+    Con TTY delega en input(); sin TTY (pipes, CI) escribe el prompt y lee
+    con sys.stdin.readline(), sin la maquinaria de readline. La TTY se
+    comprueba en cada llamada por si sys.stdin se sustituye.
+
+    Args:
+        prompt: Texto a mostrar antes de leer
+
+    Returns:
+        Línea leída sin el salto de línea final
+    """
+    stdin = sys.stdin
+    if stdin is None:
+        raise EOFError
+    if stdin.isatty():
+        return input(prompt)
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    line = stdin.readline()
+    if not line:
+        raise EOFError
+    return line.rstrip("\n")
+
+
+def _parse_int(text: str) -> Optional[int]:
+    """Convierte texto en entero sin excepciones (None si no es un entero)"""
+    m = _INT_RE.match(text)
+    return int(m.group(1)) if m else None
+
+
+def _choice_index(choice: str, n: int) -> Optional[int]:
+    """
+    Convierte una opción de menú [1..n] en índice 0-based
+
+    Args:
+        choice: Texto introducido por el usuario
+        n: Número de opciones del menú
+
+    Returns:
+        Índice 0-based o None si la opción no es válida
+    """
+    val = _parse_int(choice)
+    if val is None:
+        return None
+    idx = val - 1
+    return idx if 0 <= idx < n else None
 
 
 def select_model_interactive(valid_models: List[dict]) -> Optional[dict]:
@@ -11,7 +70,7 @@ def select_model_interactive(valid_models: List[dict]) -> Optional[dict]:
     Selección interactiva de modelo de casa
 
     Args:
-        valid_models: Lista de modelos válidos
+        valid_models: Lista de modelos válidos ordenada por dormitorios
 
     Returns:
         Modelo seleccionado o None
@@ -19,33 +78,27 @@ def select_model_interactive(valid_models: List[dict]) -> Optional[dict]:
     if not valid_models:
         return None
 
-    # Agrupar por dormitorios
-    grouped = {}
-    for m in valid_models:
-        d = m['numero_dormitorios']
-        grouped.setdefault(d, []).append(m)
-
     print("\n" + "="*60)
     print("Modelos Válidos (Agrupados por dormitorios):")
     print("="*60)
 
-    options = {}
-    idx = 1
+    options = []
 
-    for d in sorted(grouped.keys()):
+    # Los modelos llegan ordenados por dormitorios: agrupar en una pasada
+    for d, group in groupby(valid_models, key=lambda m: m['numero_dormitorios']):
         print(f"\n--- {d} Dormitorios ---")
-        for m in grouped[d]:
-            print(f"  [{idx}] {m['nombre']} "
+        for m in group:
+            options.append(m)
+            print(f"  [{len(options)}] {m['nombre']} "
                   f"({m['huella_ancho_m']}x{m['huella_largo_m']}m = "
                   f"{m['superficie_huella_m2']} m²)")
-            options[str(idx)] = m
-            idx += 1
 
     # Solicitar selección
     while True:
-        sel = input("\nIntroduce el número [N] del modelo a analizar: ").strip()
-        if sel in options:
-            return options[sel]
+        sel = _read_line("\nIntroduce el número [N] del modelo a analizar: ").strip()
+        idx = _choice_index(sel, len(options))
+        if idx is not None:
+            return options[idx]
         print("Opción no válida. Inténtalo de nuevo.")
 
 
@@ -56,41 +109,33 @@ def select_construction_system() -> Tuple[str, str]:
     Returns:
         Tuple (sistema, nivel)
     """
-    systems = list(CONSTRUCTION_PRICES.keys())
-
     print("\n" + "="*60)
     print("[Bloque 1] Sistema Constructivo:")
     print("="*60)
 
-    options = {}
-    for i, sys in enumerate(systems, 1):
-        print(f"  [{i}] {sys.capitalize()}")
-        options[str(i)] = sys
+    for i, system in enumerate(SYSTEMS, 1):
+        print(f"  [{i}] {system.capitalize()}")
 
     # Seleccionar sistema
-    selected_sys = None
-    while selected_sys is None:
-        choice = input("Selecciona sistema [N]: ").strip()
-        if choice in options:
-            selected_sys = options[choice]
-        else:
+    sys_i = None
+    while sys_i is None:
+        sys_i = _choice_index(_read_line("Selecciona sistema [N]: ").strip(), len(SYSTEMS))
+        if sys_i is None:
             print("Opción inválida.")
+    selected_sys = SYSTEMS[sys_i]
+    levels = LEVELS_BY_SYSTEM[selected_sys]
 
     # Seleccionar nivel
-    levels = list(CONSTRUCTION_PRICES[selected_sys].keys())
     print(f"\n[Bloque 1] Nivel de Acabado para {selected_sys.capitalize()}:")
 
-    level_options = {}
     for i, lvl in enumerate(levels, 1):
-        price = CONSTRUCTION_PRICES[selected_sys][lvl]
-        print(f"  [{i}] {lvl.capitalize()} ({price:,.0f} €/m²)")
-        level_options[str(i)] = lvl
+        print(f"  [{i}] {lvl.capitalize()} ({price_of(selected_sys, lvl):,.0f} €/m²)")
 
     selected_level = None
     while selected_level is None:
-        choice = input("Selecciona nivel [N]: ").strip()
-        if choice in level_options:
-            selected_level = level_options[choice]
+        idx = _choice_index(_read_line("Selecciona nivel [N]: ").strip(), len(levels))
+        if idx is not None:
+            selected_level = levels[idx]
         else:
             print("Opción inválida.")
 
@@ -108,16 +153,13 @@ def select_extras() -> List[dict]:
     print("[Bloque 6] Extras Disponibles:")
     print("="*60)
 
-    extras_list = list(EXTRAS_CATALOG.keys())
-
-    for i, key in enumerate(extras_list, 1):
-        ex = EXTRAS_CATALOG[key]
+    for i, ex in enumerate(EXTRAS_ORDERED, 1):
         if ex["type"] == "fixed":
             print(f"  [{i}] {ex['label']} — {ex['price']:,.2f} €")
         else:
             print(f"  [{i}] {ex['label']} — {ex['unit_price']:,.2f} €/ud")
 
-    sel_input = input(
+    sel_input = _read_line(
         "\nIntroduce los números separados por comas (o Enter para ninguno): "
     ).strip()
 
@@ -130,16 +172,11 @@ def select_extras() -> List[dict]:
     for token in sel_input.split(","):
         token = token.strip()
 
-        if not token.isdigit():
+        idx = _choice_index(token, len(EXTRAS_ORDERED))
+        if idx is None:
             continue
 
-        idx = int(token)
-
-        if idx < 1 or idx > len(extras_list):
-            continue
-
-        key = extras_list[idx - 1]
-        ex = EXTRAS_CATALOG[key]
+        ex = EXTRAS_ORDERED[idx]
 
         # Validar grupos (ej: solo una piscina)
         group = ex.get("group")
@@ -153,12 +190,12 @@ def select_extras() -> List[dict]:
         # Procesar según tipo
         if ex["type"] == "unit":
             while True:
-                qty_input = input(
+                qty_input = _read_line(
                     f"  Cantidad para '{ex['label']}' (número entero ≥0): "
                 ).strip()
 
-                if qty_input.isdigit():
-                    qty = int(qty_input)
+                qty = _parse_int(qty_input)
+                if qty is not None and qty >= 0:
                     selected_extras.append({
                         "label": f"{ex['label']} × {qty}",
                         "cost": qty * ex['unit_price']
@@ -182,10 +219,14 @@ def get_user_input_refcat() -> str:
     Returns:
         Referencia catastral (14 caracteres)
     """
-    refcat_full = input(
-        "\nIntroduce la referencia catastral completa: "
-    ).strip().replace(" ", "")
-    return refcat_full[:14]
+    while True:
+        refcat_full = _read_line(
+            "\nIntroduce la referencia catastral completa: "
+        ).strip().replace(" ", "")
+        refcat14 = refcat_full[:14]
+        if is_valid_refcat14(refcat14):
+            return refcat14
+        print("Referencia no válida: se esperan al menos 14 caracteres alfanuméricos.")
 
 
 def get_user_input_bedrooms() -> int:
@@ -198,14 +239,13 @@ def get_user_input_bedrooms() -> int:
     num_bedrooms = None
 
     while num_bedrooms is None:
-        try:
-            val = int(input("Número de dormitorios deseado: ").strip())
-            if val > 0:
-                num_bedrooms = val
-            else:
-                print("Debe ser un número positivo.")
-        except ValueError:
+        val = _parse_int(_read_line("Número de dormitorios deseado: "))
+        if val is None:
             print("Entrada inválida.")
+        elif val > 0:
+            num_bedrooms = val
+        else:
+            print("Debe ser un número positivo.")
 
     return num_bedrooms
 
@@ -224,7 +264,7 @@ def get_financing_parameters(
     Returns:
         Tuple (tasa_interes, años)
     """
-    use_default = input(
+    use_default = _read_line(
         f"¿Usar interés/plazo por defecto "
         f"({default_interest}% a {default_years} años)? [S/n]: "
     ).strip().lower()
@@ -234,10 +274,15 @@ def get_financing_parameters(
     else:
         try:
             interest_rate = float(
-                input("TIN anual (%): ").strip().replace(",", ".")
+                _read_line("TIN anual (%): ").strip().replace(",", ".")
             )
-            years = int(input("Plazo (años): ").strip())
-            return interest_rate, years
         except ValueError:
+            interest_rate = None
+
+        years = (_parse_int(_read_line("Plazo (años): "))
+                 if interest_rate is not None else None)
+
+        if years is None:
             print("Entrada no válida. Usando valores por defecto.")
             return default_interest, default_years
+        return interest_rate, years
@@ -2,17 +2,25 @@
 Buildlovers - Configuración y constantes
 """
 
+import os
 from dataclasses import dataclass
-from pyproj import CRS
+from functools import cached_property
 
 
 @dataclass
 class Config:
     """Configuración centralizada del sistema"""
 
-    # Sistemas de referencia
-    ETRS89_UTM30N = CRS.from_epsg(25830)
-    WGS84 = CRS.from_epsg(4326)
+    # Sistemas de referencia (pyproj se importa al primer acceso)
+    @cached_property
+    def ETRS89_UTM30N(self):
+        from pyproj import CRS
+        return CRS.from_epsg(25830)
+
+    @cached_property
+    def WGS84(self):
+        from pyproj import CRS
+        return CRS.from_epsg(4326)
 
     # Parámetros geométricos
     BBOX_BUFFER = 20.0
@@ -25,17 +33,26 @@ class Config:
     ROAD_DISTANCE_MAX = 4.0
     ROAD_BUFFER = 6.0
 
+    # Caché en disco
+    CACHE_DIR = os.path.expanduser(os.environ.get("CPQ_CACHE", "~/.cache/cpq"))
+
     # URLs de servicios
     CATASTRO_WFS_URL = "https://ovc.catastro.meh.es/INSPIRE/wfsCP.aspx"
     CATASTRO_TIMEOUT = 60
+    CATASTRO_CACHE_TTL = 30 * 24 * 3600
 
     # MDT
-    MDT_OUTPUT_PATH = "/tmp/mdt.tif"
+    MDT_OUTPUT_DIR = "/tmp/cpq_mdt"
     MDT_TIMEOUT = 120
+    MDT_INDEX_CACHE_TTL = 30 * 24 * 3600
+    MDT_RACE_GRACE = 5.0
+    MDT_FALLBACK_CACHE_TTL = 24 * 3600
 
     # OpenStreetMap
     OSM_OVERPASS_URL = "https://overpass-api.de/api/interpreter"
     OSM_TIMEOUT = 40
+    OSM_CACHE_TTL = 7 * 24 * 3600
+    OSM_MIN_BBOX_DEG2 = 1e-8
     OSM_HIGHWAY_EXCLUDE = [
         "footway", "path", "cycleway", "bridleway", "steps",
         "proposed", "construction", "corridor", "escalator",
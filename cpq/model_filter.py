@@ -2,16 +2,17 @@
 Filtrado y selección de modelos de casas
 """
 
-from typing import List
+from typing import List, Mapping
+import numpy as np
 from .config import CFG
-from .models import MODELS_DATABASE
+from .models import MODELS_BY_BEDROOMS, MODELS_TABLE
 
 
 def filter_valid_models(
     num_bedrooms: int,
     parcel_area_m2: float,
     buildable_area_m2: float
-) -> List[dict]:
+) -> List[Mapping]:
     """
     Filtra modelos válidos según criterios urbanísticos
 
@@ -21,27 +22,32 @@ def filter_valid_models(
         buildable_area_m2: Área de la caja edificable
 
     Returns:
-        Lista de modelos válidos con superficie_huella_m2 añadida
+        Lista de modelos válidos ordenada por dormitorios (registros de
+        solo lectura del catálogo)
     """
     print("\n" + "="*60)
     print("--- Pre-Filtrado Inteligente (RF-1.1.d) ---")
 
-    # Filtrar por dormitorios
-    models_by_bedrooms = [
-        m for m in MODELS_DATABASE
-        if m['numero_dormitorios'] == num_bedrooms
-    ]
+    # Filtrar por dormitorios: el catálogo está ordenado, basta un tramo contiguo
+    lo, hi = np.searchsorted(
+        MODELS_TABLE['numero_dormitorios'], (num_bedrooms, num_bedrooms + 1)
+    )
+    n_bed = int(hi - lo)
 
-    if not models_by_bedrooms:
+    if not n_bed:
         print(f"Error: No hay modelos de {num_bedrooms} dormitorios")
         return []
 
-    print(f"Encontrados {len(models_by_bedrooms)} modelos de {num_bedrooms} dormitorios")
+    print(f"Encontrados {n_bed} modelos de {num_bedrooms} dormitorios")
 
     # Calcular límites
-    parking_area = CFG.PARKING_ANCHO_M * CFG.PARKING_LARGO_M
-    max_edif = parcel_area_m2 * CFG.EDIFICABILIDAD_M2T_M2S
-    max_ocup = parcel_area_m2 * (CFG.OCUPACION_PORCENTAJE / 100.0)
+    parking_a, parking_l = CFG.PARKING_ANCHO_M, CFG.PARKING_LARGO_M
+    edif = CFG.EDIFICABILIDAD_M2T_M2S
+    ocup = CFG.OCUPACION_PORCENTAJE / 100.0
+
+    parking_area = parking_a * parking_l
+    max_edif = parcel_area_m2 * edif
+    max_ocup = parcel_area_m2 * ocup
 
     print(f"\nDatos de Parcela:")
     print(f"  -> Superficie: {parcel_area_m2:,.2f} m²")
@@ -51,30 +57,15 @@ def filter_valid_models(
     print(f"  -> Parking (reserva): {parking_area:.2f} m²")
 
     # Filtrar por normativa
-    valid_models = []
-
-    for m in models_by_bedrooms:
-        m_copy = m.copy()
-        m_copy['superficie_huella_m2'] = round(
-            m['huella_ancho_m'] * m['huella_largo_m'], 2
-        )
-
-        m2t = m['superficie_m2']
-        huella = m_copy['superficie_huella_m2']
-
-        # Criterio A: Edificabilidad
-        pass_A = m2t <= max_edif
-
-        # Criterio B: Ocupación
-        ocup_req = huella + parking_area
-        pass_B = ocup_req <= max_ocup
+    # Criterio A: Edificabilidad (el más barato, descarta primero)
+    candidates = MODELS_TABLE[lo:hi]
+    idx = lo + np.flatnonzero(candidates['superficie_m2'] <= max_edif)
 
-        # Criterio C: Caja edificable
-        area_req = huella + parking_area
-        pass_C = area_req <= buildable_area_m2
+    # Criterios B (ocupación) y C (caja edificable) sobre los supervivientes
+    area_req = MODELS_TABLE['superficie_huella_m2'][idx] + parking_area
+    idx = idx[area_req <= min(max_ocup, buildable_area_m2)]
 
-        if pass_A and pass_B and pass_C:
-            valid_models.append(m_copy)
+    valid_models = [MODELS_BY_BEDROOMS[i] for i in idx]
 
     print(f"\nModelos válidos después de filtrado: {len(valid_models)}")
 
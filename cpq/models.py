@@ -3,8 +3,12 @@ Buildlovers - Modelos de datos y catálogos
 """
 
 from dataclasses import dataclass
-from typing import Optional
-from shapely.geometry import Polygon, Point
+from types import MappingProxyType
+from typing import Optional, TYPE_CHECKING
+import numpy as np
+
+if TYPE_CHECKING:
+    from shapely.geometry import Polygon, Point
 
 
 # ==============================================================================
@@ -80,6 +84,35 @@ MODELS_DATABASE = [
     },
 ]
 
+# Huella precalculada y registros congelados (solo lectura)
+MODELS_DATABASE = [
+    MappingProxyType({
+        **m,
+        "superficie_huella_m2": round(m["huella_ancho_m"] * m["huella_largo_m"], 2)
+    })
+    for m in MODELS_DATABASE
+]
+
+# Vista ordenada por dormitorios (y model_id) para presentar por grupos
+MODELS_BY_BEDROOMS = sorted(
+    MODELS_DATABASE,
+    key=lambda m: (m['numero_dormitorios'], m['model_id'])
+)
+
+# Catálogo como array estructurado (una fila por modelo, en el mismo orden
+# que MODELS_BY_BEDROOMS) para filtrar con máscaras de NumPy
+_MODELS_FIELDS = (
+    ('numero_dormitorios', np.int32),
+    ('superficie_m2', np.float64),
+    ('huella_ancho_m', np.float64),
+    ('huella_largo_m', np.float64),
+    ('superficie_huella_m2', np.float64),
+)
+MODELS_TABLE = np.array(
+    [tuple(m[f] for f, _ in _MODELS_FIELDS) for m in MODELS_BY_BEDROOMS],
+    dtype=list(_MODELS_FIELDS)
+)
+
 
 # ==============================================================================
 # PRECIOS DE CONSTRUCCIÓN
@@ -103,6 +136,45 @@ CONSTRUCTION_PRICES = {
     }
 }
 
+# Sistemas constructivos y niveles de acabado de cada uno (orden del catálogo)
+SYSTEMS = tuple(CONSTRUCTION_PRICES)
+LEVELS_BY_SYSTEM = MappingProxyType({
+    s: tuple(levels) for s, levels in CONSTRUCTION_PRICES.items()
+})
+
+# Tabla de precios densa: filas = sistemas, columnas = todos los niveles
+# (NaN donde un sistema no ofrece ese nivel)
+_SYS_IDX = {s: i for i, s in enumerate(SYSTEMS)}
+_LVL_IDX = {
+    l: i for i, l in enumerate(dict.fromkeys(
+        l for levels in LEVELS_BY_SYSTEM.values() for l in levels
+    ))
+}
+_PRICE_MATRIX = np.array(
+    [[CONSTRUCTION_PRICES[s].get(l, np.nan) for l in _LVL_IDX] for s in SYSTEMS],
+    dtype=np.float64
+)
+
+
+def price_of(sys_name: str, level_name: str) -> float:
+    """
+    Precio base de construcción (€/m²) para un sistema y nivel
+
+    Args:
+        sys_name: Sistema constructivo (clave de CONSTRUCTION_PRICES)
+        level_name: Nivel de acabado
+
+    Returns:
+        Precio por m²
+
+    Raises:
+        KeyError: Si el sistema no ofrece ese nivel
+    """
+    price = float(_PRICE_MATRIX[_SYS_IDX[sys_name], _LVL_IDX[level_name]])
+    if np.isnan(price):
+        raise KeyError(level_name)
+    return price
+
 
 # ==============================================================================
 # CATÁLOGO DE EXTRAS
@@ -165,16 +237,35 @@ EXTRAS_CATALOG = {
     },
 }
 
+# Extras en orden de menú como registros de solo lectura (con su clave)
+EXTRAS_ORDERED = tuple(
+    MappingProxyType({"key": k, **v}) for k, v in EXTRAS_CATALOG.items()
+)
+
 
 # ==============================================================================
 # DATACLASSES
 # ==============================================================================
 
-@dataclass
+@dataclass(frozen=True)
 class ParcelAnalysisResult:
-    """Resultado del análisis de límites de parcela"""
+    """Resultado del análisis de límites de parcela (inmutable, sin __dict__)"""
+    __slots__ = (
+        "fence_cost", "buildable_geometry", "frontal_length_m",
+        "lateral_length_m", "access_point"
+    )
+
     fence_cost: float
-    buildable_geometry: Optional[Polygon]
+    buildable_geometry: Optional["Polygon"]
     frontal_length_m: float
     lateral_length_m: float
-    access_point: Point
+    access_point: "Point"
+
+    # Sin __dict__, copy/pickle restauran los slots con setattr, que la
+    # clase congelada prohíbe: se guarda y restaura el estado explícitamente
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            object.__setattr__(self, name, value)
@@ -2,8 +2,8 @@
 Servicios externos (Catastro, MDT, OSM)
 """
 
-from .catastro import CatastroService
+from .catastro import CatastroService, is_valid_refcat14
 from .mdt import MDTService
 from .osm import OSMService
 
-__all__ = ['CatastroService', 'MDTService', 'OSMService']
+__all__ = ['CatastroService', 'MDTService', 'OSMService', 'is_valid_refcat14']
@@ -2,18 +2,108 @@
 Servicio de acceso a datos del Catastro
 """
 
-import requests
-import geopandas as gpd
-from io import BytesIO
-from typing import Optional
+import shutil
+from pathlib import Path
+from tempfile import SpooledTemporaryFile
+from typing import Optional, Tuple, TYPE_CHECKING
 
 from ..config import CFG
+from ..utils.cache import read_cache, write_cache
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+
+
+# Referencias sin parcela en el Catastro durante esta sesión
+_FAILED_REFCATS = set()
+
+
+def is_valid_refcat14(refcat14) -> bool:
+    """Comprueba el formato de una referencia catastral de 14 caracteres"""
+    return isinstance(refcat14, str) and len(refcat14) == 14 and refcat14.isalnum()
 
 
 class CatastroService:
     """Servicio para consultas al Catastro mediante WFS"""
 
-    def get_parcel_geometry(self, refcat14: str) -> Optional[gpd.GeoDataFrame]:
+    _SPOOL_MAX = 65536
+    _CHUNK = 65536
+    _SNIFF = b"Exception"
+
+    def __init__(self):
+        self._cache_dir = Path(CFG.CACHE_DIR) / "catastro"
+
+    def _cache_path(self, refcat14: str, endpoint: str) -> Optional[Path]:
+        """Ruta en caché de una respuesta (None si la refcat no es segura)"""
+        if not refcat14.isalnum():
+            return None
+        return self._cache_dir / f"{refcat14}_{endpoint}.gml"
+
+    def _read_cache(self, path: Optional[Path]) -> Optional["gpd.GeoDataFrame"]:
+        """Respuesta cacheada y vigente, o None"""
+        import geopandas as gpd
+
+        gdf = read_cache(path, CFG.CATASTRO_CACHE_TTL, gpd.read_file) if path else None
+        if gdf is not None:
+            print(f"[Catastro] Usando caché: {path.name}")
+        return gdf
+
+    def _write_cache(self, path: Optional[Path], spool) -> None:
+        """Guarda en caché la respuesta volcada en spool"""
+        if path is None:
+            return
+
+        def _copy(tmp_path):
+            with open(tmp_path, "wb") as f:
+                shutil.copyfileobj(spool, f)
+
+        try:
+            write_cache(path, _copy)
+        except OSError as e:
+            print(f"[Catastro] No se pudo guardar en caché: {e}")
+
+    @staticmethod
+    def _is_empty_collection(spool) -> bool:
+        """True si la respuesta (pequeña) es una FeatureCollection sin elementos"""
+        body = spool.read()
+        spool.seek(0)
+        return b"FeatureCollection" in body and (
+            b'numberReturned="0"' in body or b'numberMatched="0"' in body
+        )
+
+    def _spool_response(self, r) -> Tuple[SpooledTemporaryFile, int, bool]:
+        """
+        Vuelca una respuesta en streaming a un fichero temporal
+
+        Las respuestas pequeñas quedan en memoria y las grandes pasan a
+        disco. Mientras se copia se busca el marcador de excepción WFS.
+
+        Args:
+            r: Respuesta de requests abierta con stream=True
+
+        Returns:
+            Tuple (fichero rebobinado, tamaño en bytes, hay excepción)
+        """
+        spool = SpooledTemporaryFile(max_size=self._SPOOL_MAX)
+        size = 0
+        found = False
+        tail = b""
+        keep = len(self._SNIFF) - 1
+
+        for chunk in r.iter_content(self._CHUNK):
+            if not found:
+                window = tail + chunk
+                found = self._SNIFF in window
+                # Se arrastra sobre la ventana completa: un trozo más corto
+                # que keep no debe descartar los bytes anteriores
+                tail = window[-keep:]
+            spool.write(chunk)
+            size += len(chunk)
+
+        spool.seek(0)
+        return spool, size, found
+
+    def get_parcel_geometry(self, refcat14: str) -> Optional["gpd.GeoDataFrame"]:
         """
         Obtiene la geometría de una parcela catastral
 
@@ -23,6 +113,16 @@ class CatastroService:
         Returns:
             GeoDataFrame con la geometría de la parcela o None si falla
         """
+        if not is_valid_refcat14(refcat14):
+            print(f"[Catastro] Referencia catastral no válida: {refcat14!r}")
+            return None
+        if refcat14 in _FAILED_REFCATS:
+            print(f"[Catastro] Parcela {refcat14} no encontrada (sesión)")
+            return None
+
+        import requests
+        import geopandas as gpd
+
         print(f"[Catastro] Obteniendo parcela {refcat14}...")
         params = {
             "SERVICE": "WFS",
@@ -34,19 +134,36 @@ class CatastroService:
         }
 
         try:
-            r = requests.get(
-                CFG.CATASTRO_WFS_URL,
-                params=params,
-                timeout=CFG.CATASTRO_TIMEOUT
-            )
-            r.raise_for_status()
-
-            if len(r.content) < 1000 or "Exception" in r.text:
-                return None
-
-            gdf = gpd.read_file(BytesIO(r.content))
+            cache_path = self._cache_path(refcat14, "parcel")
+            gdf = self._read_cache(cache_path)
+
+            if gdf is None:
+                with requests.get(
+                    CFG.CATASTRO_WFS_URL,
+                    params=params,
+                    timeout=CFG.CATASTRO_TIMEOUT,
+                    stream=True
+                ) as r:
+                    r.raise_for_status()
+                    spool, size, has_exc = self._spool_response(r)
+
+                with spool:
+                    # Solo un "no encontrada" definitivo entra en la lista de
+                    # la sesión; un ExceptionReport puede ser un fallo pasajero
+                    if has_exc:
+                        return None
+                    if size < 1000:
+                        if self._is_empty_collection(spool):
+                            _FAILED_REFCATS.add(refcat14)
+                        return None
+
+                    gdf = gpd.read_file(spool)
+                    if not gdf.empty:
+                        spool.seek(0)
+                        self._write_cache(cache_path, spool)
 
             if gdf.empty:
+                _FAILED_REFCATS.add(refcat14)
                 return None
 
             if gdf.crs is None:
@@ -62,7 +179,7 @@ class CatastroService:
             print(f"[Catastro] Error: {e}")
             return None
 
-    def get_neighbor_parcels(self, refcat14: str) -> Optional[gpd.GeoDataFrame]:
+    def get_neighbor_parcels(self, refcat14: str) -> Optional["gpd.GeoDataFrame"]:
         """
         Obtiene las parcelas vecinas a una referencia catastral
 
@@ -72,6 +189,12 @@ class CatastroService:
         Returns:
             GeoDataFrame con las parcelas vecinas o None si falla
         """
+        if not is_valid_refcat14(refcat14) or refcat14 in _FAILED_REFCATS:
+            return None
+
+        import requests
+        import geopandas as gpd
+
         print(f"[Catastro] Obteniendo vecinos...")
         params = {
             "SERVICE": "WFS",
@@ -83,16 +206,28 @@ class CatastroService:
         }
 
         try:
-            r = requests.get(
-                CFG.CATASTRO_WFS_URL,
-                params=params,
-                timeout=CFG.CATASTRO_TIMEOUT
-            )
-
-            if r.status_code != 200 or len(r.content) < 1000:
-                return None
-
-            gdf = gpd.read_file(BytesIO(r.content))
+            cache_path = self._cache_path(refcat14, "neighbors")
+            gdf = self._read_cache(cache_path)
+
+            if gdf is None:
+                with requests.get(
+                    CFG.CATASTRO_WFS_URL,
+                    params=params,
+                    timeout=CFG.CATASTRO_TIMEOUT,
+                    stream=True
+                ) as r:
+                    if r.status_code != 200:
+                        return None
+                    spool, size, _ = self._spool_response(r)
+
+                with spool:
+                    if size < 1000:
+                        return None
+
+                    gdf = gpd.read_file(spool)
+                    if not gdf.empty:
+                        spool.seek(0)
+                        self._write_cache(cache_path, spool)
 
             if gdf.empty:
                 return None
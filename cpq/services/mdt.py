@@ -2,14 +2,76 @@
 Servicio de descarga de Modelo Digital del Terreno (MDT)
 """
 
+import hashlib
 import os
-import requests
+import queue
+import shutil
+import threading
+import time
 import zipfile
-import geopandas as gpd
-from shapely.geometry import box
-from typing import Optional, Tuple
+from typing import Callable, Optional, Tuple, TYPE_CHECKING
 
 from ..config import CFG
+from ..utils.cache import read_cache, write_cache
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+
+
+# Coberturas WCS 2.0.1 por orden de prioridad: (URL, COVERAGEID)
+_WCS_COVERAGES = (
+    ("https://servicios.idee.es/wcs-inspire/mdt02", "Elevacion25830_2"),   # MDT02 (2m)
+    ("https://servicios.idee.es/wcs-inspire/mdt", "Elevacion25830_5"),     # MDT05 (5m)
+    ("https://servicios.idee.es/wcs-inspire/mdt", "Elevacion25830_25"),    # MDT25 (25m)
+)
+
+# Firmas de cabecera TIFF (little / big endian)
+_TIFF_MAGIC = (b"II*\x00", b"MM\x00*")
+
+# Bloque de copia al volcar respuestas a disco (1 MiB)
+_COPY_CHUNK = 1 << 20
+
+# Servicio antiguo (WCS 1.0.0)
+_WCS_LEGACY_URL = "https://www.ign.es/wcs/mdt"
+_WCS_LEGACY_COVERAGE = "mdt:Elevacion25830_25"
+
+
+def _make_wcs2_params(cov_id: str, minx: float, maxx: float, miny: float, maxy: float) -> list:
+    """Parámetros GetCoverage WCS 2.0.1 para una cobertura y un bbox"""
+    return [
+        ("SERVICE", "WCS"),
+        ("VERSION", "2.0.1"),
+        ("REQUEST", "GetCoverage"),
+        ("COVERAGEID", cov_id),
+        ("FORMAT", "image/tiff"),
+        ("SUBSETTINGCRS", "EPSG:25830"),
+        ("SUBSET", f"x({minx},{maxx})"),
+        ("SUBSET", f"y({miny},{maxy})"),
+    ]
+
+
+def _wcs_target(minx: float, miny: float, maxx: float, maxy: float, cov_id: str) -> str:
+    """Ruta de descarga propia de un bbox y una cobertura"""
+    key = hashlib.blake2b(
+        f"{minx:.2f}{miny:.2f}{maxx:.2f}{maxy:.2f}{cov_id}".encode(),
+        digest_size=8
+    ).hexdigest()
+    return os.path.join(CFG.MDT_OUTPUT_DIR, f"{key}.tif")
+
+
+def _make_wcs1_params(minx: float, miny: float, maxx: float, maxy: float) -> dict:
+    """Parámetros GetCoverage WCS 1.0.0 del servicio antiguo"""
+    return {
+        "SERVICE": "WCS",
+        "VERSION": "1.0.0",
+        "REQUEST": "GetCoverage",
+        "COVERAGE": _WCS_LEGACY_COVERAGE,
+        "CRS": "EPSG:25830",
+        "BBOX": f"{minx},{miny},{maxx},{maxy}",
+        "WIDTH": "200",
+        "HEIGHT": "200",
+        "FORMAT": "GeoTIFF",
+    }
 
 
 class MDTService:
@@ -19,6 +81,56 @@ class MDTService:
     """
 
     MDT02_INDEX_URL = "https://centrodedescargas.cnig.es/CentroDescargas/geojson/MDT02_ETRS89.geojson"
+    MDT02_INDEX_CACHE = os.path.join(CFG.CACHE_DIR, "mdt", "mdt02_index.parquet")
+
+    # Índice MDT02 ya leído y reproyectado (compartido entre instancias)
+    _index_gdf: Optional["gpd.GeoDataFrame"] = None
+
+    def __init__(self, log: Callable[[str], None] = print):
+        """
+        Args:
+            log: Destino de los mensajes de progreso (por defecto print);
+                 permite diferirlos cuando la descarga va en segundo plano
+        """
+        self._log = log
+
+    @classmethod
+    def _get_index(cls, log: Callable[[str], None] = print) -> "gpd.GeoDataFrame":
+        """
+        Devuelve el índice MDT02 en EPSG:25830
+
+        Orden: memoria → Parquet en disco (si pyarrow está disponible y no
+        ha caducado) → descarga del GeoJSON del CNIG.
+
+        Args:
+            log: Destino de los mensajes de progreso
+
+        Returns:
+            GeoDataFrame del índice de hojas
+        """
+        if cls._index_gdf is not None:
+            return cls._index_gdf
+
+        import geopandas as gpd
+
+        path = cls.MDT02_INDEX_CACHE
+        idx_gdf = read_cache(path, CFG.MDT_INDEX_CACHE_TTL, gpd.read_parquet)
+
+        if idx_gdf is None:
+            idx_gdf = gpd.read_file(cls.MDT02_INDEX_URL)
+
+            if idx_gdf.crs is None:
+                idx_gdf.set_crs(epsg=25830, inplace=True)
+            else:
+                idx_gdf = idx_gdf.to_crs(25830)
+
+            try:
+                write_cache(path, idx_gdf.to_parquet)
+            except Exception as e:
+                log(f"[MDT] Índice MDT02 no cacheado en disco: {e}")
+
+        cls._index_gdf = idx_gdf
+        return idx_gdf
 
     def _expand_bbox(
         self,
@@ -44,24 +156,24 @@ class MDTService:
         Returns:
             Ruta al archivo TIF descargado o None si falla
         """
+        import numpy as np
+        import requests
+        from shapely.geometry import box
+
         try:
             os.makedirs(out_dir, exist_ok=True)
 
             # Leer índice
-            idx_gdf = gpd.read_file(self.MDT02_INDEX_URL)
+            idx_gdf = self._get_index(self._log)
 
-            if idx_gdf.crs is None:
-                idx_gdf.set_crs(epsg=25830, inplace=True)
-            else:
-                idx_gdf = idx_gdf.to_crs(25830)
-
-            # Buscar hojas que intersectan
+            # Buscar hojas que intersectan (índice espacial, orden original)
             minx, miny, maxx, maxy = map(float, bbox)
             bbox_poly = box(minx, miny, maxx, maxy)
-            hits = idx_gdf[idx_gdf.intersects(bbox_poly)]
+            pos = idx_gdf.sindex.query(bbox_poly, predicate="intersects")
+            hits = idx_gdf.iloc[np.sort(pos)]
 
             if hits.empty:
-                print("[MDT] MDT02 índice: ninguna hoja intersecta el bbox")
+                self._log("[MDT] MDT02 índice: ninguna hoja intersecta el bbox")
                 return None
 
             # Obtener URL de descarga
@@ -73,41 +185,156 @@ class MDTService:
                     break
 
             if not download_url:
-                print("[MDT] MDT02 índice: no se encontró campo de descarga en el GeoJSON")
+                self._log("[MDT] MDT02 índice: no se encontró campo de descarga en el GeoJSON")
                 return None
 
             # Descargar
             local_path = os.path.join(out_dir, os.path.basename(download_url))
-            print(f"[MDT] Descargando MDT02 por índice: {download_url}")
+            self._log(f"[MDT] Descargando MDT02 por índice: {download_url}")
 
-            r = requests.get(download_url, stream=True, timeout=CFG.MDT_TIMEOUT)
-            r.raise_for_status()
+            with requests.get(download_url, stream=True, timeout=CFG.MDT_TIMEOUT) as r:
+                r.raise_for_status()
+                r.raw.decode_content = True
 
-            with open(local_path, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
+                with open(local_path, "wb") as f:
+                    shutil.copyfileobj(r.raw, f, length=_COPY_CHUNK)
 
             # Extraer si es ZIP
             if local_path.lower().endswith(".zip"):
-                with zipfile.ZipFile(local_path, "r") as zf:
-                    zf.extractall(out_dir)
-
-                for fn in os.listdir(out_dir):
-                    if fn.lower().endswith(".tif"):
-                        tif_path = os.path.join(out_dir, fn)
-                        print(f"[MDT] MDT02 por índice OK → {tif_path}")
-                        return tif_path
-
-                print("[MDT] MDT02 por índice: ZIP descargado pero sin .tif dentro")
-                return None
+                written = []
+                try:
+                    with zipfile.ZipFile(local_path, "r") as zf:
+                        names = zf.namelist()
+                        tifs = [n for n in names if n.lower().endswith(".tif")]
+
+                        if not tifs:
+                            self._log("[MDT] MDT02 por índice: ZIP descargado pero sin .tif dentro")
+                            return None
+
+                        # Solo el TIF y sus ficheros auxiliares (.tfw, .prj, ...)
+                        stem = os.path.splitext(tifs[0])[0]
+                        for name in names:
+                            if not name.startswith(stem + "."):
+                                continue
+                            dst_path = os.path.join(out_dir, os.path.basename(name))
+                            written.append(dst_path)
+                            with zf.open(name) as src, open(dst_path, "wb") as dst:
+                                shutil.copyfileobj(src, dst, length=_COPY_CHUNK)
+                except BaseException:
+                    # Extracción a medias: no dejar TIF ni auxiliares incompletos
+                    for path in written:
+                        try:
+                            os.remove(path)
+                        except OSError:
+                            pass
+                    raise
+                finally:
+                    # El ZIP nunca se conserva (éxito, sin TIF o error)
+                    try:
+                        os.unlink(local_path)
+                    except OSError:
+                        pass
+
+                tif_path = os.path.join(out_dir, os.path.basename(tifs[0]))
+                self._log(f"[MDT] MDT02 por índice OK → {tif_path}")
+                return tif_path
             else:
-                print(f"[MDT] MDT02 por índice OK → {local_path}")
+                self._log(f"[MDT] MDT02 por índice OK → {local_path}")
                 return local_path
 
         except Exception as e:
-            print(f"[MDT] MDT02 por índice falló: {e}")
+            self._log(f"[MDT] MDT02 por índice falló: {e}")
             return None
 
+    def _fetch_wcs(
+        self,
+        url: str,
+        params,
+        part_path: str,
+        stop: threading.Event
+    ) -> Optional[str]:
+        """
+        Descarga una cobertura WCS a un fichero temporal propio
+
+        Args:
+            url: Endpoint WCS
+            params: Parámetros GetCoverage
+            part_path: Fichero temporal de este intento
+            stop: Evento para abandonar la descarga si otro intento ya ganó
+
+        Returns:
+            Ruta al fichero temporal con el TIFF o None si falla
+        """
+        import requests
+
+        try:
+            with requests.get(url, params=params, timeout=CFG.MDT_TIMEOUT, stream=True) as r:
+                ct = r.headers.get("Content-Type", "").lower()
+                r.raw.decode_content = True
+                head4 = r.raw.read(4) if r.status_code == 200 else b""
+                is_tiff = ct.endswith("tiff") or head4 in _TIFF_MAGIC
+
+                # Abortar sin descargar el cuerpo (típicamente un ExceptionReport)
+                if r.status_code != 200 or not is_tiff:
+                    self._log(f"[MDT] ✗ {url} no devolvió un TIFF válido")
+                    return None
+
+                with open(part_path, "wb") as f:
+                    f.write(head4)
+                    for chunk in iter(lambda: r.raw.read(_COPY_CHUNK), b""):
+                        if stop.is_set():
+                            break
+                        f.write(chunk)
+                    size = f.tell()
+
+            if stop.is_set():
+                os.remove(part_path)
+                return None
+
+            if size > 1000:
+                return part_path
+
+            os.remove(part_path)
+            self._log(f"[MDT] ✗ {url} no devolvió un TIFF válido")
+
+        except Exception as e:
+            self._log(f"[MDT] ✗ Error con {url}: {e}")
+
+        return None
+
+    @staticmethod
+    def _is_cached(target: str, fallback: bool) -> bool:
+        """
+        Comprueba si hay una descarga WCS reutilizable en disco
+
+        Las coberturas de respaldo (menor resolución) caducan tras
+        CFG.MDT_FALLBACK_CACHE_TTL y se borran para volver a intentar la
+        de mayor prioridad.
+
+        Args:
+            target: Ruta del fichero cacheado
+            fallback: True si no es la cobertura de mayor prioridad
+
+        Returns:
+            True si el fichero existe, es válido y no ha caducado
+        """
+        try:
+            st = os.stat(target)
+        except OSError:
+            return False
+
+        if st.st_size <= 1000:
+            return False
+
+        if fallback and time.time() - st.st_mtime > CFG.MDT_FALLBACK_CACHE_TTL:
+            try:
+                os.remove(target)
+            except OSError:
+                pass
+            return False
+
+        return True
+
     def _try_download_for_bbox(
         self,
         bbox: Tuple[float, float, float, float]
@@ -115,6 +342,17 @@ class MDTService:
         """
         Intenta descargar MDT vía WCS en diferentes resoluciones
 
+        Cada bbox y cobertura tiene su propio fichero. Si la cobertura de
+        mayor prioridad ya está en caché se reutiliza sin tocar la red; una
+        cobertura de menor resolución en caché (válida durante
+        CFG.MDT_FALLBACK_CACHE_TTL) solo se usa si las de mayor prioridad
+        vuelven a fallar.
+
+        Lanza todos los endpoints a la vez. En cuanto uno devuelve un TIFF
+        válido se espera como mucho CFG.MDT_RACE_GRACE segundos a los de
+        mayor prioridad (mayor resolución) que sigan pendientes; el resto
+        se abandona.
+
         Args:
             bbox: Bounding box (minx, miny, maxx, maxy)
 
@@ -124,72 +362,99 @@ class MDTService:
         minx, miny, maxx, maxy = map(float, bbox)
 
         attempts = [
-            # MDT02 (2m)
-            ("https://servicios.idee.es/wcs-inspire/mdt02", [
-                ("SERVICE", "WCS"),
-                ("VERSION", "2.0.1"),
-                ("REQUEST", "GetCoverage"),
-                ("COVERAGEID", "Elevacion25830_2"),
-                ("FORMAT", "image/tiff"),
-                ("SUBSETTINGCRS", "EPSG:25830"),
-                ("SUBSET", f"x({minx},{maxx})"),
-                ("SUBSET", f"y({miny},{maxy})"),
-            ]),
-            # MDT05 (5m)
-            ("https://servicios.idee.es/wcs-inspire/mdt", [
-                ("SERVICE", "WCS"),
-                ("VERSION", "2.0.1"),
-                ("REQUEST", "GetCoverage"),
-                ("COVERAGEID", "Elevacion25830_5"),
-                ("FORMAT", "image/tiff"),
-                ("SUBSETTINGCRS", "EPSG:25830"),
-                ("SUBSET", f"x({minx},{maxx})"),
-                ("SUBSET", f"y({miny},{maxy})"),
-            ]),
-            # MDT25 (25m)
-            ("https://servicios.idee.es/wcs-inspire/mdt", [
-                ("SERVICE", "WCS"),
-                ("VERSION", "2.0.1"),
-                ("REQUEST", "GetCoverage"),
-                ("COVERAGEID", "Elevacion25830_25"),
-                ("FORMAT", "image/tiff"),
-                ("SUBSETTINGCRS", "EPSG:25830"),
-                ("SUBSET", f"x({minx},{maxx})"),
-                ("SUBSET", f"y({miny},{maxy})"),
-            ]),
-            # Servicio antiguo
-            ("https://www.ign.es/wcs/mdt", {
-                "SERVICE": "WCS",
-                "VERSION": "1.0.0",
-                "REQUEST": "GetCoverage",
-                "COVERAGE": "mdt:Elevacion25830_25",
-                "CRS": "EPSG:25830",
-                "BBOX": f"{minx},{miny},{maxx},{maxy}",
-                "WIDTH": "200",
-                "HEIGHT": "200",
-                "FORMAT": "GeoTIFF",
-            })
+            (url, _make_wcs2_params(cov_id, minx, maxx, miny, maxy),
+             _wcs_target(minx, miny, maxx, maxy, cov_id))
+            for url, cov_id in _WCS_COVERAGES
         ]
-
-        for url, params in attempts:
+        attempts.append((_WCS_LEGACY_URL, _make_wcs1_params(minx, miny, maxx, maxy),
+                         _wcs_target(minx, miny, maxx, maxy, _WCS_LEGACY_COVERAGE)))
+
+        # Caché por bbox: la primera cobertura válida ya descargada
+        cached = None
+        for i, (url, _, target) in enumerate(attempts):
+            if self._is_cached(target, fallback=i > 0):
+                cached = i
+                break
+
+        if cached == 0:
+            url, _, target = attempts[0]
+            self._log(f"[MDT] ✓ MDT en caché ({url}) → {target}")
+            return target
+
+        # Solo se compite por coberturas mejores que la cacheada
+        if cached is not None:
+            attempts = attempts[:cached + 1]
+            fallback_url, _, fallback_target = attempts.pop()
+
+        os.makedirs(CFG.MDT_OUTPUT_DIR, exist_ok=True)
+
+        stop = threading.Event()
+        lock = threading.Lock()
+        results = {}
+        done_q = queue.Queue()
+
+        def worker(i, url, params, target):
+            part_path = f"{target}.{os.getpid()}.partial"
+            path = self._fetch_wcs(url, params, part_path, stop)
+            with lock:
+                if path and stop.is_set():
+                    os.remove(path)
+                elif path:
+                    results[i] = path
+            done_q.put(i)
+
+        # Hilos daemon: un endpoint colgado no bloquea la salida del proceso
+        for i, (url, params, target) in enumerate(attempts):
+            threading.Thread(target=worker, args=(i, url, params, target), daemon=True).start()
+
+        finished = set()
+        deadline = None
+
+        while len(finished) < len(attempts):
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                break
             try:
-                r = requests.get(url, params=params, timeout=CFG.MDT_TIMEOUT)
-                ct = r.headers.get("Content-Type", "").lower()
-                head4 = r.content[:4]
-                is_tiff = ct.endswith("tiff") or head4 in (b"II*\x00", b"MM\x00*")
+                finished.add(done_q.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+            with lock:
+                best = min(results, default=None)
+            if best is not None:
+                # Ninguno de mayor prioridad pendiente: no hay nada mejor que esperar
+                if all(j in finished for j in range(best)):
+                    break
+                if deadline is None:
+                    deadline = time.monotonic() + CFG.MDT_RACE_GRACE
 
-                if r.status_code == 200 and is_tiff and len(r.content) > 1000:
-                    with open(CFG.MDT_OUTPUT_PATH, "wb") as f:
-                        f.write(r.content)
-                    print(f"[MDT] ✓ Descargado MDT vía WCS desde {url}")
-                    return CFG.MDT_OUTPUT_PATH
-                else:
-                    print(f"[MDT] ✗ {url} no devolvió un TIFF válido")
+        with lock:
+            stop.set()
+            ready = dict(results)
 
-            except Exception as e:
-                print(f"[MDT] ✗ Error con {url}: {e}")
+        if not ready:
+            if cached is not None:
+                self._log(f"[MDT] ✓ MDT en caché ({fallback_url}) → {fallback_target}")
+                return fallback_target
+            return None
 
-        return None
+        best = min(ready)
+        for i, path in ready.items():
+            if i != best:
+                os.remove(path)
+
+        url, _, target = attempts[best]
+        os.replace(ready[best], target)
+
+        # La cobertura de respaldo cacheada queda superada
+        if cached is not None:
+            try:
+                os.remove(fallback_target)
+            except OSError:
+                pass
+
+        self._log(f"[MDT] ✓ Descargado MDT vía WCS desde {url}")
+        return target
 
     def download_mdt(self, bbox: Tuple[float, float, float, float]) -> Optional[str]:
         """
@@ -201,7 +466,7 @@ class MDTService:
         Returns:
             Ruta al archivo MDT descargado o None si falla
         """
-        print("[MDT] Solicitando topografía (prioridad MDT02 por índice)…")
+        self._log("[MDT] Solicitando topografía (prioridad MDT02 por índice)…")
 
         # Intento 1: MDT02 por índice
         path = self._download_mdt02_from_index(bbox)
@@ -209,24 +474,24 @@ class MDTService:
             return path
 
         # Intento 2: WCS bbox original
-        print("[MDT] Pasando a WCS (2 m → 5 m → 25 m)…")
+        self._log("[MDT] Pasando a WCS (2 m → 5 m → 25 m)…")
         path = self._try_download_for_bbox(bbox)
         if path:
             return path
 
         # Intento 3: bbox +25m
         bbox_big = self._expand_bbox(bbox, 25.0)
-        print("[MDT] Reintentando WCS con bbox +25 m…")
+        self._log("[MDT] Reintentando WCS con bbox +25 m…")
         path = self._try_download_for_bbox(bbox_big)
         if path:
             return path
 
         # Intento 4: bbox +50m
         bbox_bigger = self._expand_bbox(bbox, 50.0)
-        print("[MDT] Reintentando WCS con bbox +50 m…")
+        self._log("[MDT] Reintentando WCS con bbox +50 m…")
         path = self._try_download_for_bbox(bbox_bigger)
         if path:
             return path
 
-        print("[MDT] ✗ No se pudo descargar ningún MDT")
+        self._log("[MDT] ✗ No se pudo descargar ningún MDT")
         return None
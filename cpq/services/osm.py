@@ -2,19 +2,71 @@
 Servicio de acceso a datos de OpenStreetMap
 """
 
-import requests
-import geopandas as gpd
-from pyproj import Transformer
-from shapely.geometry import LineString
-from typing import Tuple
+import functools
+import hashlib
+from pathlib import Path
+from typing import Tuple, TYPE_CHECKING
 
+try:
+    import orjson  # Opcional: parser JSON más rápido
+except ImportError:
+    orjson = None
+
+from .. import __version__
 from ..config import CFG
+from ..utils.cache import read_cache, write_cache
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+    from pyproj import Transformer
+
+# Plantilla de la consulta Overpass: el timeout se rellena en cada llamada
+# (CFG.OSM_TIMEOUT puede modificarse en tiempo de ejecución) junto al bbox
+_OSM_EXCLUDE = "|".join(CFG.OSM_HIGHWAY_EXCLUDE)
+_OSM_TEMPLATE = (
+    "[out:json][timeout:{timeout}];"
+    f'(way["highway"]["highway"!~"{_OSM_EXCLUDE}"]({{s}},{{w}},{{n}},{{e}}););'
+    "out geom;"
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_transformer(src, dst) -> "Transformer":
+    """Transformer (always_xy) reutilizable entre llamadas para un par de CRS"""
+    from pyproj import Transformer
+
+    return Transformer.from_crs(src, dst, always_xy=True)
 
 
 class OSMService:
     """Servicio para consultas a OpenStreetMap vía Overpass API"""
 
-    def fetch_roads(self, bbox: Tuple) -> gpd.GeoDataFrame:
+    def __init__(self):
+        import requests
+        from requests.adapters import HTTPAdapter, Retry
+
+        # Sesión persistente: keep-alive y reintentos ante 429/5xx de Overpass
+        retry = Retry(
+            total=3,
+            backoff_factor=1.5,
+            status_forcelist=[429, 502, 503, 504],
+            allowed_methods=["POST"]
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._session.headers["User-Agent"] = f"cpq/{__version__}"
+        self._session.headers["Accept-Encoding"] = "gzip, deflate"
+        self._cache_dir = Path(CFG.CACHE_DIR) / "osm"
+
+    def _cache_path(self, bbox: Tuple) -> Path:
+        """Ruta en caché de una consulta (bbox redondeado a 0.1 m + exclusiones)"""
+        key = repr((*(round(float(v), 1) for v in bbox), _OSM_EXCLUDE)).encode()
+        digest = hashlib.blake2b(key, digest_size=16).hexdigest()
+        return self._cache_dir / f"{digest}.feather"
+
+    def fetch_roads(self, bbox: Tuple) -> "gpd.GeoDataFrame":
         """
         Consulta red viaria desde OSM
 
@@ -24,72 +76,93 @@ class OSMService:
         Returns:
             GeoDataFrame con geometrías de carreteras
         """
+        import geopandas as gpd
+
         print("[OSM] Consultando red viaria...")
 
         try:
             minx, miny, maxx, maxy = bbox
 
-            # Transformar a WGS84 para Overpass
-            to_wgs84 = Transformer.from_crs(
-                CFG.ETRS89_UTM30N,
-                CFG.WGS84,
-                always_xy=True
-            )
-            west, south = to_wgs84.transform(minx, miny)
-            east, north = to_wgs84.transform(maxx, maxy)
+            cache_path = self._cache_path(bbox)
+            gdf = read_cache(cache_path, CFG.OSM_CACHE_TTL, gpd.read_feather)
+            if gdf is not None:
+                print(f"[OSM] Usando caché: {cache_path.name}")
+                print(f"[OSM] {len(gdf)} segmentos")
+                return gdf
 
-            if west > east:
-                west, east = east, west
-            if south > north:
-                south, north = north, south
+            # Transformar a WGS84 para Overpass
+            to_wgs84 = _get_transformer(CFG.ETRS89_UTM30N, CFG.WGS84)
+            xs, ys = to_wgs84.transform([minx, maxx], [miny, maxy])
+            west, east = min(xs), max(xs)
+            south, north = min(ys), max(ys)
+
+            # Bbox por debajo de la resolución útil de Overpass: no cabe una vía
+            if not (north - south) * (east - west) >= CFG.OSM_MIN_BBOX_DEG2:
+                print("[OSM] Bbox demasiado pequeño, se omite la consulta")
+                return gpd.GeoDataFrame(geometry=[], crs=CFG.ETRS89_UTM30N)
 
             # Construir query Overpass
-            exclude = "|".join(CFG.OSM_HIGHWAY_EXCLUDE)
-            query = f"""[out:json][timeout:{CFG.OSM_TIMEOUT}];
-            (way["highway"]["highway"!~"{exclude}"]({south},{west},{north},{east}););
-            out geom;"""
+            query = _OSM_TEMPLATE.format(
+                timeout=CFG.OSM_TIMEOUT, s=south, w=west, n=north, e=east
+            )
 
             # Ejecutar consulta
-            r = requests.post(
+            r = self._session.post(
                 CFG.OSM_OVERPASS_URL,
                 data={"data": query},
                 timeout=CFG.OSM_TIMEOUT + 10
             )
             r.raise_for_status()
-            data = r.json()
-
-            # Procesar resultados
-            lines = []
-            to_utm = Transformer.from_crs(
-                CFG.WGS84,
-                CFG.ETRS89_UTM30N,
-                always_xy=True
-            )
+            data = orjson.loads(r.content) if orjson is not None else r.json()
 
-            for el in data.get("elements", []):
-                if el.get("type") != "way":
-                    continue
+            # Overpass informa de timeouts/errores de ejecución con HTTP 200 y
+            # un "remark": el resultado puede estar incompleto, no se cachea
+            remark = data.get("remark")
+            if remark:
+                print(f"[OSM] Aviso de Overpass: {remark}")
 
-                geom = el.get("geometry", [])
-                if not geom:
-                    continue
-
-                coords_utm = []
-                for p in geom:
-                    x, y = to_utm.transform(p["lon"], p["lat"])
-                    coords_utm.append((x, y))
+            # Procesar resultados
+            to_utm = _get_transformer(CFG.WGS84, CFG.ETRS89_UTM30N)
 
-                if len(coords_utm) >= 2:
-                    lines.append(LineString(coords_utm))
+            # Vías con al menos 2 vértices
+            ways = [
+                el["geometry"] for el in data.get("elements", [])
+                if el.get("type") == "way" and len(el.get("geometry", [])) >= 2
+            ]
 
-            if not lines:
+            # Sin vías no se cachea: un vacío no se distingue de un fallo parcial
+            if not ways:
                 return gpd.GeoDataFrame(geometry=[], crs=CFG.ETRS89_UTM30N)
 
+            import numpy as np
+            import shapely
+
+            # Una sola transformación para todos los vértices, in situ sobre
+            # buffers float64 contiguos (sin arrays de salida intermedios)
+            xs = np.fromiter((p["lon"] for g in ways for p in g), dtype=np.float64)
+            ys = np.fromiter((p["lat"] for g in ways for p in g), dtype=np.float64)
+            to_utm.transform(xs, ys, inplace=True)
+
+            # Construcción de todas las LineStrings en una llamada
+            offsets = np.zeros(len(ways) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(g) for g in ways])
+            lines = shapely.from_ragged_array(
+                shapely.GeometryType.LINESTRING,
+                np.column_stack((xs, ys)),
+                (offsets,)
+            )
+
             print(f"[OSM] {len(lines)} segmentos")
-            return gpd.GeoDataFrame(
+            gdf = gpd.GeoDataFrame(
                 {"geometry": lines},
                 crs=CFG.ETRS89_UTM30N
             )
+            if not remark:
+                try:
+                    write_cache(cache_path, gdf.to_feather)
+                except Exception as e:
+                    print(f"[OSM] No se pudo guardar en caché: {e}")
+            return gdf
 
         except Exception as e:
             print(f"[OSM] Error: {e}")
@@ -1,13 +1,17 @@
 """
-Utilidades varias (geometría, finanzas)
+Utilidades varias (geometría, finanzas, caché en disco)
 """
 
 from .geometry import safe_float, bbox_from_gdf, create_house_pad
-from .finance import compute_monthly_payment
+from .finance import compute_monthly_payment, pmt_array
+from .cache import read_cache, write_cache
 
 __all__ = [
     'safe_float',
     'bbox_from_gdf',
     'create_house_pad',
-    'compute_monthly_payment'
+    'compute_monthly_payment',
+    'pmt_array',
+    'read_cache',
+    'write_cache'
 ]
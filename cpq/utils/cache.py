@@ -0,0 +1,56 @@
+"""
+Caché en disco con caducidad y escritura atómica
+"""
+
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+
+
+def read_cache(path, ttl: float, loader: Callable[[str], Any]) -> Optional[Any]:
+    """
+    Lee una entrada de caché si existe y no ha caducado
+
+    Args:
+        path: Ruta del fichero en caché
+        ttl: Validez en segundos desde la última escritura
+        loader: Función que lee el fichero (ej: gpd.read_parquet)
+
+    Returns:
+        Resultado de loader o None si no hay caché válida
+    """
+    try:
+        if time.time() - os.path.getmtime(path) > ttl:
+            return None
+        return loader(path)
+    except Exception:
+        return None
+
+
+def write_cache(path, writer: Callable[[str], None]) -> None:
+    """
+    Escribe una entrada de caché de forma atómica (tmp + rename)
+
+    Args:
+        path: Ruta final del fichero
+        writer: Función que escribe el contenido en la ruta temporal recibida
+
+    Raises:
+        Exception: Error de writer o del sistema de ficheros (el temporal se borra)
+    """
+    path = os.fspath(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    # Temporal único por proceso e hilo en el mismo directorio (rename atómico)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+
+    try:
+        writer(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
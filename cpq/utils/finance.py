@@ -4,6 +4,38 @@ Utilidades de cálculos financieros
 
 import math
 
+try:
+    from numba import njit  # Opcional: compila el núcleo de la cuota
+except ImportError:
+    def njit(*args, **kwargs):
+        """Sustituto sin numba: devuelve la función sin compilar"""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda fn: fn
+
+
+# Firma explícita: compilación en la importación, persistida en disco
+@njit("f8(f8, f8, i8)", cache=True)
+def _pmt_kernel(principal, r, n):
+    """
+    Núcleo numérico de la cuota (sistema francés) con r != 0
+
+    Args:
+        principal: Capital prestado
+        r: Tipo de interés mensual (fracción)
+        n: Número de cuotas
+
+    Returns:
+        Cuota mensual sin redondear (NaN si el denominador es 0)
+    """
+    factor = (1.0 + r) ** float(n)
+    denom = factor - 1.0
+
+    if denom == 0.0:
+        return math.nan
+
+    return principal * (r * factor) / denom
+
 
 def compute_monthly_payment(
     principal: float,
@@ -19,7 +51,7 @@ def compute_monthly_payment(
         years: Plazo en años
 
     Returns:
-        Cuota mensual o 0.0 si error
+        Cuota mensual o 0.0 si error (capital o plazo no positivos)
     """
     try:
         principal = float(principal)
@@ -28,25 +60,54 @@ def compute_monthly_payment(
     except (ValueError, TypeError):
         return 0.0
 
-    if principal <= 0:
-        return 0.0
-
     n = years * 12
+
+    if principal <= 0 or n <= 0:
+        return 0.0
     r = (annual_rate / 100.0) / 12.0
 
     if r == 0:
         return round(principal / n, 2)
 
-    factor = (1 + r) ** n
-    denom = factor - 1
-
-    if denom == 0:
-        return 0.0
-
-    monthly = principal * (r * factor) / denom
-    monthly = float(monthly)
+    monthly = float(_pmt_kernel(principal, r, n))
 
     if math.isnan(monthly) or math.isinf(monthly):
         return 0.0
 
     return round(monthly, 2)
+
+
+def pmt_array(principals, annual_rates, years):
+    """
+    Cuotas mensuales para arrays de escenarios (capital, TIN, plazo)
+
+    Mismo criterio que compute_monthly_payment, con broadcasting de NumPy.
+
+    Args:
+        principals: Capitales prestados
+        annual_rates: TIN anuales en porcentaje
+        years: Plazos en años
+
+    Returns:
+        Array de cuotas mensuales redondeadas (0.0 donde no hay cuota válida)
+    """
+    import numpy as np
+
+    p, rate, y = np.broadcast_arrays(
+        np.asarray(principals, dtype=np.float64),
+        np.asarray(annual_rates, dtype=np.float64),
+        np.asarray(years, dtype=np.int64)
+    )
+    n = (y * 12).astype(np.float64)
+    r = (rate / 100.0) / 12.0
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        factor = (1.0 + r) ** n
+        monthly = np.where(
+            r == 0,
+            p / n,
+            p * (r * factor) / (factor - 1.0)
+        )
+
+    monthly = np.where((p > 0) & (n > 0) & np.isfinite(monthly), monthly, 0.0)
+    return np.round(monthly, 2)
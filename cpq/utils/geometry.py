@@ -3,12 +3,13 @@ Utilidades geométricas
 """
 
 import math
-import geopandas as gpd
-from shapely.geometry import box
-from typing import Tuple, Optional
+from typing import Tuple, Optional, TYPE_CHECKING
 
 from ..config import CFG
 
+if TYPE_CHECKING:
+    import geopandas as gpd
+
 
 def safe_float(value, default=0.0) -> float:
     """
@@ -27,9 +28,18 @@ def safe_float(value, default=0.0) -> float:
 
         if hasattr(value, '__array__'):
             import numpy as np
-            if np.isnan(value).any():
+
+            # Valores enmascarados: asarray perdería la máscara
+            if np.ma.is_masked(value):
                 return default
 
+            # Solo escalares numéricos (0-d) se convierten; arrays con
+            # dimensiones (ej: [[5]] tras desenvolver) devuelven el defecto
+            arr = np.asarray(value)
+            if arr.ndim != 0 or arr.dtype.kind not in "biuf":
+                return default
+            value = arr.item()
+
         f = float(value)
 
         if math.isnan(f) or math.isinf(f):
@@ -42,7 +52,7 @@ def safe_float(value, default=0.0) -> float:
 
 
 def bbox_from_gdf(
-    gdf: gpd.GeoDataFrame,
+    gdf: "gpd.GeoDataFrame",
     buffer: float = 20.0
 ) -> Tuple[float, float, float, float]:
     """
@@ -55,15 +65,25 @@ def bbox_from_gdf(
     Returns:
         Tuple (minx, miny, maxx, maxy)
     """
-    minx, miny, maxx, maxy = gdf.total_bounds
-    return (minx - buffer, miny - buffer, maxx + buffer, maxy + buffer)
+    import numpy as np
+    import shapely
+
+    # Envolventes en una sola llamada vectorizada sobre el array de geometrías
+    arr = shapely.bounds(np.asarray(gdf.geometry.values))
+
+    if arr.shape[0] == 0 or np.isnan(arr).all():
+        return (np.nan, np.nan, np.nan, np.nan)
+
+    lo = np.nanmin(arr[:, :2], axis=0) - buffer
+    hi = np.nanmax(arr[:, 2:], axis=0) + buffer
+    return (lo[0], lo[1], hi[0], hi[1])
 
 
 def create_house_pad(
-    buildable_gdf: gpd.GeoDataFrame,
+    buildable_gdf: "gpd.GeoDataFrame",
     width_m: float,
     length_m: float
-) -> Optional[gpd.GeoDataFrame]:
+) -> Optional["gpd.GeoDataFrame"]:
     """
     Crea la huella de una casa centrada en zona edificable
 
@@ -75,8 +95,12 @@ def create_house_pad(
     Returns:
         GeoDataFrame con la huella o None si falla
     """
+    import geopandas as gpd
+    from shapely.geometry import box
+
     try:
-        if buildable_gdf.crs != CFG.ETRS89_UTM30N:
+        crs = buildable_gdf.crs
+        if crs is None or not crs.equals(CFG.ETRS89_UTM30N):
             buildable_gdf = buildable_gdf.to_crs(CFG.ETRS89_UTM30N)
 
         geom = buildable_gdf.geometry.iloc[0]
@@ -86,12 +110,7 @@ def create_house_pad(
         half_w, half_l = width_m / 2, length_m / 2
         pad_polygon = box(cx - half_w, cy - half_l, cx + half_w, cy + half_l)
 
-        pad_gdf = gpd.GeoDataFrame(
-            [{"geometry": pad_polygon}],
-            crs=CFG.ETRS89_UTM30N
-        )
-
-        return pad_gdf
+        return gpd.GeoDataFrame(geometry=[pad_polygon], crs=CFG.ETRS89_UTM30N)
 
     except Exception as e:
         print(f"Error creando huella: {e}")
@@ -6,10 +6,12 @@ Script principal ejecutable
 
 import sys
 import math
+import threading
+from concurrent.futures import Future
 import geopandas as gpd
 
 from cpq.config import CFG
-from cpq.models import CONSTRUCTION_PRICES
+from cpq.models import price_of
 from cpq.services import CatastroService, MDTService, OSMService
 from cpq.analysis import (
     ParcelBoundaryAnalyzer,
@@ -37,6 +39,43 @@ from cpq.cli import (
 )
 
 
+def run_in_background(fn, *args) -> Future:
+    """
+    Ejecuta una función en un hilo daemon y devuelve su Future
+
+    A diferencia de ThreadPoolExecutor, el hilo no retrasa la salida del
+    programa si este termina antes (sys.exit) de recoger el resultado.
+
+    Args:
+        fn: Función a ejecutar
+        *args: Argumentos posicionales
+
+    Returns:
+        Future con el resultado o la excepción de fn
+    """
+    fut = Future()
+
+    def _run():
+        if not fut.set_running_or_notify_cancel():
+            return
+        try:
+            fut.set_result(fn(*args))
+        except BaseException as e:
+            fut.set_exception(e)
+
+    threading.Thread(target=_run, daemon=True).start()
+    return fut
+
+
+def _sanitize_metrics(metrics: dict, keys) -> dict:
+    """Sustituye por 0.0 los valores ausentes, None o no finitos de las claves indicadas"""
+    for key in keys:
+        val = metrics.get(key)
+        if val is None or (isinstance(val, float) and not math.isfinite(val)):
+            metrics[key] = 0.0
+    return metrics
+
+
 def main():
     """Función principal del programa"""
 
@@ -56,7 +95,10 @@ def main():
     # =========================================================================
 
     catastro_svc = CatastroService()
-    mdt_svc = MDTService()
+    # Los mensajes del MDT se acumulan y se muestran al recoger la descarga,
+    # para no mezclarse con el análisis ni con los menús interactivos
+    mdt_log = []
+    mdt_svc = MDTService(log=mdt_log.append)
     osm_svc = OSMService()
 
     # =========================================================================
@@ -80,15 +122,20 @@ def main():
 
     bbox = bbox_from_gdf(gdf_parcel, buffer=20.0)
 
+    # El MDT no depende del análisis: descargarlo en paralelo (PASO 7)
+    print("\n--- Descargando topografía (en segundo plano) ---")
+    fut_mdt = run_in_background(mdt_svc.download_mdt, bbox)
+
     analyzer = ParcelBoundaryAnalyzer(catastro_svc, osm_svc)
     analysis_result = analyzer.analyze(gdf_parcel, refcat14, bbox)
 
-    if (not analysis_result.buildable_geometry or
-        analysis_result.buildable_geometry.is_empty):
+    buildable_geom = analysis_result.buildable_geometry
+
+    if buildable_geom is None or buildable_geom.is_empty:
         print("Error: No se pudo calcular la caja edificable.")
         sys.exit(1)
 
-    buildable_area_m2 = analysis_result.buildable_geometry.area
+    buildable_area_m2 = buildable_geom.area
 
     # =========================================================================
     # PASO 5: Filtrar modelos válidos
@@ -121,8 +168,11 @@ def main():
     # PASO 7: Descargar MDT
     # =========================================================================
 
-    print("\n--- Descargando topografía ---")
-    mdt_path = mdt_svc.download_mdt(bbox)
+    print("\n--- Esperando topografía ---")
+    mdt_path = fut_mdt.result()
+
+    for line in mdt_log:
+        print(line)
 
     if mdt_path is None:
         print("⚠️  No se pudo descargar el MDT.")
@@ -133,7 +183,7 @@ def main():
     # =========================================================================
 
     buildable_gdf = gpd.GeoDataFrame(
-        [{"geometry": analysis_result.buildable_geometry}],
+        [{"geometry": buildable_geom}],
         crs=CFG.ETRS89_UTM30N
     )
 
@@ -152,14 +202,11 @@ def main():
     vol_metrics = compute_volume_metrics(huella_gdf, mdt_path)
 
     # Verificación de seguridad
-    for key in ['z_optimal_m', 'cut_m3', 'fill_m3', 'balance_m3']:
-        val = vol_metrics.get(key, 0.0)
-        if val is None or (isinstance(val, float) and
-                          (math.isnan(val) or math.isinf(val))):
-            vol_metrics[key] = 0.0
+    _sanitize_metrics(vol_metrics, ('z_optimal_m', 'cut_m3', 'fill_m3', 'balance_m3'))
+    cut_m3 = vol_metrics['cut_m3']
+    fill_m3 = vol_metrics['fill_m3']
 
-    print(f"  [DEBUG] Volúmenes OK: cut={vol_metrics['cut_m3']:.2f}, "
-          f"fill={vol_metrics['fill_m3']:.2f}")
+    print(f"  [DEBUG] Volúmenes OK: cut={cut_m3:.2f}, fill={fill_m3:.2f}")
 
     # Pendiente
     print("\n  [DEBUG] Calculando pendiente...")
@@ -170,26 +217,21 @@ def main():
         slope_pct = 0.0
     else:
         _, _, slope_pct, _ = calc_pendiente(xs, ys, zs)
-        if math.isnan(slope_pct) or math.isinf(slope_pct):
+        if not math.isfinite(slope_pct):
             slope_pct = 0.0
         print(f"  [DEBUG] Pendiente calculada: {slope_pct:.2f}%")
 
     # Mostrar métricas
     print(f"\nMétricas topográficas:")
-    cut_display = (0.0 if math.isnan(vol_metrics.get('cut_m3', 0.0))
-                  else vol_metrics.get('cut_m3', 0.0))
-    fill_display = (0.0 if math.isnan(vol_metrics.get('fill_m3', 0.0))
-                   else vol_metrics.get('fill_m3', 0.0))
-
-    if cut_display == 0.0 and fill_display == 0.0:
+    if cut_m3 == 0.0 and fill_m3 == 0.0:
         print(f"  ⚠️  Sin datos topográficos válidos")
         print(f"  - Desmonte: 0.00 m³")
         print(f"  - Terraplén: 0.00 m³")
         print(f"  - Pendiente: {slope_pct:.2f} %")
         print(f"  (La huella puede estar fuera del área MDT o sin datos)")
     else:
-        print(f"  - Desmonte: {cut_display:.2f} m³")
-        print(f"  - Terraplén: {fill_display:.2f} m³")
+        print(f"  - Desmonte: {cut_m3:.2f} m³")
+        print(f"  - Terraplén: {fill_m3:.2f} m³")
         print(f"  - Pendiente: {slope_pct:.2f} %")
 
     # =========================================================================
@@ -197,7 +239,7 @@ def main():
     # =========================================================================
 
     system, level = select_construction_system()
-    base_price_m2 = CONSTRUCTION_PRICES[system][level]
+    base_price_m2 = price_of(system, level)
 
     # =========================================================================
     # PASO 10: CALCULAR COSTES